@@ -0,0 +1,702 @@
+import array
+import hashlib
+import json
+import os
+import sqlite3
+import time
+#
+import idc
+import idaapi
+import idautils
+import ida_hexrays
+#
+from idaclu import ida_shims
+from idaclu import ida_utils
+from idaclu import plg_utils
+
+
+PSDO_CACHE_CAP = 64 * 1024 * 1024  # bytes of pseudocode kept on disk per IDB
+PSDO_CACHE_SYNC = 256  # cache writes between commits
+PSDO_SKIP_FAILED = True  # skip functions the decompiler failed on before
+
+
+class FeatureStore(object):
+    """Lazily extracted per-function artefacts of a single IDB.
+
+    Entries are keyed by function start address and validated by the hash
+    of the function bytes, so patched functions are re-extracted while
+    the rest is shared between sub-plugin runs. IDB-wide tables are kept
+    along with a caller-provided key they are rebuilt on change of.
+    """
+
+    def __init__(self, idb_path):
+        self.idb_path = idb_path
+        self.entries = {}
+        self.tables = {}
+        self.types_sign = None  # digest of the local types, None until taken
+        self.hooks = FeatureStoreHooks(self)
+        self.hooks.hook()
+        self.psdo_hooks = None
+        if hasattr(ida_hexrays, 'Hexrays_Hooks') and ida_hexrays.init_hexrays_plugin():
+            self.psdo_hooks = FeatureStorePsdoHooks(self)
+            self.psdo_hooks.hook()
+
+    def get_entry(self, func_addr):
+        # hashing the view of the cached segment bytes takes no copy
+        func_bytes = ida_utils.get_func_bytes(func_addr)
+        func_hash = hashlib.md5(func_bytes).hexdigest()
+        entry = self.entries.get(func_addr)
+        if entry is None or entry['hash'] != func_hash:
+            entry = {'hash': func_hash, 'byts': func_bytes.tobytes()}
+            self.entries[func_addr] = entry
+        return entry
+
+    def get_feature(self, func_addr, name, extract):
+        entry = self.get_entry(func_addr)
+        if name not in entry:
+            entry[name] = extract(func_addr)
+        return entry[name]
+
+    def get_table(self, name, key, build):
+        table = self.tables.get(name)
+        if table is None or table[0] != key:
+            table = (key, build())
+            self.tables[name] = table
+        return table[1]
+
+    def invalidate(self, func_addr=None):
+        if func_addr is None:
+            self.entries.clear()
+            self.tables.clear()
+        else:
+            self.entries.pop(func_addr, None)
+
+    def invalidate_psdo(self, func_addr):
+        # the persistent pseudocode record goes along with the entry
+        self.invalidate(func_addr)
+        psdo_cache = _psdo_caches.get(self.idb_path)
+        if psdo_cache:
+            psdo_cache.drop(func_addr)
+
+
+class FeatureStoreHooks(idaapi.IDB_Hooks):
+    """Drop the entries of the functions referring to a renamed or retyped item.
+
+    Names and types of the referred items and operand representations show
+    in the disassembly and the pseudocode of a function without changing
+    its bytes.
+    """
+
+    def __init__(self, store):
+        idaapi.IDB_Hooks.__init__(self)
+        self.store = store
+
+    def invalidate_refs(self, ea):
+        self.store.invalidate_psdo(ea)
+        for xref in idautils.XrefsTo(ea):
+            func_inst = idaapi.get_func(xref.frm)
+            if func_inst:
+                self.store.invalidate_psdo(ida_shims.start_ea(func_inst))
+        return 0
+
+    def renamed(self, ea, *args):
+        return self.invalidate_refs(ea)
+
+    def ti_changed(self, ea, *args):
+        return self.invalidate_refs(ea)
+
+    def func_updated(self, pfn, *args):
+        # the flow graph may change with the function, its bytes need not
+        self.store.invalidate(ida_shims.start_ea(pfn))
+        return 0
+
+    def func_tail_appended(self, pfn, *args):
+        return self.func_updated(pfn)
+
+    def func_tail_deleted(self, pfn, *args):
+        return self.func_updated(pfn)
+
+    def op_type_changed(self, ea, *args):
+        # operand representation shows in the function the operand is in
+        func_inst = idaapi.get_func(ea)
+        if func_inst:
+            self.store.invalidate_psdo(ida_shims.start_ea(func_inst))
+        return 0
+
+    def local_types_changed(self, *args):
+        # pseudocode records are keyed by the types digest, the stale ones
+        # are no longer hit and get evicted in time
+        self.store.types_sign = None
+        self.store.entries.clear()
+        return 0
+
+    def closebase(self, *args):
+        close_store(self.store.idb_path)
+        return 0
+
+
+class FeatureStorePsdoHooks(getattr(ida_hexrays, 'Hexrays_Hooks', object)):
+    """Drop the pseudocode of a function its local variables or comments were edited in."""
+
+    def __init__(self, store):
+        ida_hexrays.Hexrays_Hooks.__init__(self)
+        self.store = store
+
+    def invalidate(self, vu):
+        self.store.invalidate_psdo(vu.cfunc.entry_ea)
+        return 0
+
+    def lvar_name_changed(self, vu, *args):
+        return self.invalidate(vu)
+
+    def lvar_type_changed(self, vu, *args):
+        return self.invalidate(vu)
+
+    def lvar_cmt_changed(self, vu, *args):
+        return self.invalidate(vu)
+
+    def cmt_changed(self, cfunc, *args):
+        self.store.invalidate_psdo(cfunc.entry_ea)
+        return 0
+
+
+class FuncTable(object):
+    """Columnar metrics of all the functions of a single IDB.
+
+    Rows are addressed by a dense function id and are filled for all
+    functions at once, except for the flow graph counts that are taken
+    on the first lookup. IDB events mark the rows of changed functions
+    and the folders stale, these are re-read on their next lookup.
+    """
+
+    def __init__(self, idb_path, is_folders=False):
+        self.idb_path = idb_path
+        self.is_folders = is_folders
+        self.ids = {}
+        self.addrs = []
+        self.names = []
+        self.folders = []
+        self.sizes = array.array('l')
+        self.chunks = array.array('l')
+        self.nodes = array.array('l')  # -1 until the flow graph is counted
+        self.edges = array.array('l')
+        self.colors = plg_utils.get_offset_array()
+        self.stale = set()
+        self.is_folders_stale = is_folders
+        for func_addr in idautils.Functions():
+            self.add_row(func_addr)
+        self.hooks = FuncTableHooks(self)
+        self.hooks.hook()
+
+    def add_row(self, func_addr):
+        func_id = len(self.addrs)
+        self.ids[func_addr] = func_id
+        self.addrs.append(func_addr)
+        self.names.append(None)
+        self.folders.append('/')
+        for column in [self.sizes, self.chunks, self.nodes, self.edges, self.colors]:
+            column.append(-1)
+        if self.read_row(func_id):
+            return func_id
+        # no function starts here, the row is dropped again
+        for column in [self.addrs, self.names, self.folders, self.sizes, self.chunks,
+                       self.nodes, self.edges, self.colors]:
+            column.pop()
+        return None
+
+    def read_row(self, func_id):
+        func_addr = self.addrs[func_id]
+        func_inst = idaapi.get_func(func_addr)
+        if func_inst is None or ida_shims.start_ea(func_inst) != func_addr:
+            del self.ids[func_addr]
+            return False
+        self.names[func_id] = ida_shims.get_func_name(func_addr)
+        self.sizes[func_id] = ida_shims.calc_func_size(func_inst)
+        self.chunks[func_id] = len(list(idautils.Chunks(func_addr)))
+        self.colors[func_id] = ida_shims.get_color(func_addr, idc.CIC_FUNC)
+        self.nodes[func_id] = -1
+        self.edges[func_id] = -1
+        return True
+
+    def read_folders(self):
+        func_dirs = ida_utils.get_dir_funcs(ida_utils.get_func_dirs('/'))
+        for func_addr, func_id in self.ids.items():
+            self.folders[func_id] = func_dirs.get(func_addr, '/')
+        self.is_folders_stale = False
+
+    def get_id(self, func_addr, is_graph=True):
+        """Get the id of an up-to-date row of the function containing 'func_addr', None if there is none.
+
+        Flow graph counts are left as they are unless 'is_graph' is set.
+        """
+        func_id = self.ids.get(func_addr)
+        if func_id is None:
+            # an address inside of a function stands for the function
+            func_inst = idaapi.get_func(func_addr)
+            if func_inst is None:
+                return None
+            func_addr = ida_shims.start_ea(func_inst)
+            func_id = self.ids.get(func_addr)
+        if func_id is None:
+            func_id = self.add_row(func_addr)
+            self.is_folders_stale = self.is_folders
+            if func_id is None:
+                return None
+        elif func_id in self.stale:
+            self.stale.discard(func_id)
+            if not self.read_row(func_id):
+                return None
+        if is_graph and self.nodes[func_id] < 0:
+            self.nodes[func_id], self.edges[func_id] = ida_utils.get_nodes_edges(func_addr)
+        if self.is_folders_stale:
+            self.read_folders()
+        return func_id
+
+    def set_folder(self, func_addr, folder):
+        func_id = self.ids.get(func_addr)
+        if func_id is not None:
+            self.folders[func_id] = folder
+
+    def invalidate(self, func_addr=None):
+        if func_addr is None:
+            self.stale.update(self.ids.values())
+            self.is_folders_stale = self.is_folders
+        elif func_addr in self.ids:
+            self.stale.add(self.ids[func_addr])
+
+    def invalidate_folders(self):
+        self.is_folders_stale = self.is_folders
+
+
+class FuncTableHooks(idaapi.IDB_Hooks):
+    """Mark the rows of the functions changed in the database stale."""
+
+    def __init__(self, func_table):
+        idaapi.IDB_Hooks.__init__(self)
+        self.func_table = func_table
+
+    def invalidate(self, func_inst):
+        self.func_table.invalidate(ida_shims.start_ea(func_inst))
+        return 0
+
+    def func_updated(self, pfn, *args):
+        # also sent on change of the function color
+        return self.invalidate(pfn)
+
+    def deleting_func(self, pfn, *args):
+        return self.invalidate(pfn)
+
+    def set_func_start(self, pfn, *args):
+        # the row of the old start is dropped, the new one is added on lookup
+        return self.invalidate(pfn)
+
+    def set_func_end(self, pfn, *args):
+        return self.invalidate(pfn)
+
+    def func_tail_appended(self, pfn, *args):
+        return self.invalidate(pfn)
+
+    def func_tail_deleted(self, pfn, *args):
+        return self.invalidate(pfn)
+
+    def tail_owner_changed(self, tail, owner_func, old_owner, *args):
+        self.func_table.invalidate(owner_func)
+        self.func_table.invalidate(old_owner)
+        return 0
+
+    def renamed(self, ea, *args):
+        self.func_table.invalidate(ea)
+        return 0
+
+    # folders are changed in the function tree view as well, the events
+    # come from all the trees, the folders are re-read on the next lookup
+    def dirtree_mkdir(self, *args):
+        self.func_table.invalidate_folders()
+        return 0
+
+    def dirtree_rmdir(self, *args):
+        self.func_table.invalidate_folders()
+        return 0
+
+    def dirtree_link(self, *args):
+        self.func_table.invalidate_folders()
+        return 0
+
+    def dirtree_move(self, *args):
+        self.func_table.invalidate_folders()
+        return 0
+
+    def closebase(self, *args):
+        close_func_table(self.func_table.idb_path)
+        return 0
+
+
+class PsdoCache(object):
+    """On-disk cache of pseudocode text and ctree-derived summaries.
+
+    Records live in an SQLite file next to the IDB and are keyed by
+    function address and a hash of the function bytes, name and type,
+    of the names and types of the code and data it refers to, of its
+    user-edited local variables and comments and of the local types.
+    Once the total text size
+    exceeds the cap, the least recently used records are evicted.
+    """
+
+    def __init__(self, db_path, size_cap=PSDO_CACHE_CAP):
+        self.db_path = db_path
+        self.size_cap = size_cap
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS psdo ("
+            "func_addr TEXT PRIMARY KEY, func_hash TEXT, psdo_text TEXT, "
+            "summaries TEXT, size INTEGER, used INTEGER)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS psdo_used ON psdo (used)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS psdo_fail ("
+            "func_addr TEXT PRIMARY KEY, func_hash TEXT, reason TEXT, elapsed REAL)")
+        self.size, self.tick = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0), COALESCE(MAX(used), 0) FROM psdo").fetchone()
+        self.writes = 0
+
+    def get(self, func_addr, func_hash):
+        row = self.conn.execute(
+            "SELECT psdo_text, summaries FROM psdo WHERE func_addr = ? AND func_hash = ?",
+            (hex(func_addr), func_hash)).fetchone()
+        if row is None:
+            return None
+        self.tick += 1
+        self.conn.execute("UPDATE psdo SET used = ? WHERE func_addr = ?", (self.tick, hex(func_addr)))
+        self.sync()
+        return {'text': row[0], 'summaries': json.loads(row[1])}
+
+    def put(self, func_addr, func_hash, record):
+        psdo_text = record['text']
+        summaries = json.dumps(record['summaries'])
+        size = len(psdo_text or '') + len(summaries)
+        old = self.conn.execute("SELECT size FROM psdo WHERE func_addr = ?", (hex(func_addr),)).fetchone()
+        if old:
+            self.size -= old[0]
+        self.tick += 1
+        self.conn.execute(
+            "INSERT OR REPLACE INTO psdo VALUES (?, ?, ?, ?, ?, ?)",
+            (hex(func_addr), func_hash, psdo_text, summaries, size, self.tick))
+        self.size += size
+        if self.size > self.size_cap:
+            self.evict()
+        self.sync()
+
+    def get_fail(self, func_addr, func_hash):
+        # failures are not evicted, a new hash is the only way to retry
+        row = self.conn.execute(
+            "SELECT reason, elapsed FROM psdo_fail WHERE func_addr = ? AND func_hash = ?",
+            (hex(func_addr), func_hash)).fetchone()
+        return {'reason': row[0], 'elapsed': row[1]} if row else None
+
+    def put_fail(self, func_addr, func_hash, fail):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO psdo_fail VALUES (?, ?, ?, ?)",
+            (hex(func_addr), func_hash, fail['reason'], fail['elapsed']))
+        self.sync()
+
+    def drop(self, func_addr):
+        row = self.conn.execute("SELECT size FROM psdo WHERE func_addr = ?", (hex(func_addr),)).fetchone()
+        if row:
+            self.size -= row[0]
+            self.conn.execute("DELETE FROM psdo WHERE func_addr = ?", (hex(func_addr),))
+            self.sync()
+
+    def evict(self):
+        # drop the least recently used records down to 90% of the cap
+        rows = self.conn.execute("SELECT func_addr, size FROM psdo ORDER BY used").fetchall()
+        stale = []
+        for func_addr, size in rows:
+            if self.size <= self.size_cap * 0.9:
+                break
+            stale.append((func_addr,))
+            self.size -= size
+        self.conn.executemany("DELETE FROM psdo WHERE func_addr = ?", stale)
+
+    def close(self):
+        self.sync(is_forced=True)
+        self.conn.close()
+
+    def sync(self, is_forced=False):
+        self.writes += 1
+        if is_forced or self.writes >= PSDO_CACHE_SYNC:
+            self.conn.commit()
+            self.writes = 0
+
+
+_stores = {}
+_psdo_caches = {}
+_func_tables = {}
+
+def get_store():
+    idb_path = ida_shims.get_idb_path()
+    if idb_path not in _stores:
+        _stores[idb_path] = FeatureStore(idb_path)
+    return _stores[idb_path]
+
+def get_func_table(is_folders=False):
+    idb_path = ida_shims.get_idb_path()
+    if idb_path not in _func_tables:
+        _func_tables[idb_path] = FuncTable(idb_path, is_folders)
+    return _func_tables[idb_path]
+
+def get_psdo_cache():
+    idb_path = ida_shims.get_idb_path()
+    if idb_path not in _psdo_caches:
+        idb_name = os.path.splitext(os.path.basename(idb_path))[0]
+        db_path = os.path.join(os.path.dirname(idb_path), "{}_idaclu_psdo.sqlite".format(idb_name))
+        try:
+            _psdo_caches[idb_path] = PsdoCache(db_path)
+        except sqlite3.Error:
+            _psdo_caches[idb_path] = None
+    return _psdo_caches[idb_path]
+
+def close_store(idb_path):
+    # the pseudocode cache is committed and closed along with the store
+    store = _stores.pop(idb_path, None)
+    if store:
+        store.hooks.unhook()
+        if store.psdo_hooks:
+            store.psdo_hooks.unhook()
+    psdo_cache = _psdo_caches.pop(idb_path, None)
+    if psdo_cache:
+        psdo_cache.close()
+
+def close_func_table(idb_path):
+    func_table = _func_tables.pop(idb_path, None)
+    if func_table:
+        func_table.hooks.unhook()
+
+def flush():
+    for psdo_cache in _psdo_caches.values():
+        if psdo_cache:
+            psdo_cache.sync(is_forced=True)
+
+
+def extract_items(func_addr):
+    return list(idautils.FuncItems(func_addr))
+
+def extract_heads(func_addr):
+    return list(idaapi.get_func(func_addr).head_items())
+
+def extract_mnems(func_addr):
+    # heads include all code items
+    return dict((ea, ida_shims.print_insn_mnem(ea)) for ea in get_func_heads(func_addr))
+
+def extract_code(func_addr):
+    return [ea for ea in get_func_items(func_addr)
+            if ida_shims.is_code(ida_shims.get_full_flags(ea))]
+
+def extract_dasm(func_addr):
+    func_instructs = []
+    for item in get_code_items(func_addr):
+        dasm = ida_shims.generate_disasm_line(item, idaapi.GENDSM_FORCE_CODE)
+        dasm_clean = dasm.split(';')[0]  # remove comments
+        func_instructs.append(dasm_clean)
+    return func_instructs
+
+def extract_psdo(func_addr):
+    cfunc = idaapi.decompile(func_addr)
+    return str(cfunc) if cfunc else None
+
+def get_types_sign():
+    # local types digest, taken once per change of the types
+    store = get_store()
+    if store.types_sign is None:
+        types_hash = hashlib.md5()
+        for ordinal in range(1, ida_shims.get_ordinal_limit()):
+            types_hash.update((ida_shims.get_local_type(ordinal) or '').encode('utf-8'))
+        store.types_sign = types_hash.hexdigest()
+    return store.types_sign
+
+def get_user_sign(func_addr):
+    # decompiler settings the user made for the function, names, types
+    # and comments of local variables and comments of the pseudocode
+    sign = []
+    if not ida_hexrays.init_hexrays_plugin():
+        return sign
+    lvinf = ida_hexrays.lvar_uservec_t()
+    if ida_hexrays.restore_user_lvar_settings(lvinf, func_addr):
+        for lvar in lvinf.lvvec:
+            sign.extend([lvar.name, str(lvar.type), lvar.cmt])
+    user_cmts = ida_hexrays.restore_user_cmts(func_addr)
+    if user_cmts is not None:
+        cmt_iter = ida_hexrays.user_cmts_begin(user_cmts)
+        while cmt_iter != ida_hexrays.user_cmts_end(user_cmts):
+            tree_loc = ida_hexrays.user_cmts_first(cmt_iter)
+            sign.extend([hex(tree_loc.ea), str(ida_hexrays.user_cmts_second(cmt_iter))])
+            cmt_iter = ida_hexrays.user_cmts_next(cmt_iter)
+        ida_hexrays.user_cmts_free(user_cmts)
+    return sign
+
+def get_psdo_sign(func_addr):
+    # names and types the decompiler output depends on besides the bytes,
+    # those of the function, of the code and data it refers to outside of
+    # itself, of its local variables and of the local types
+    sign = [ida_shims.get_func_name(func_addr), ida_shims.get_type(func_addr) or '']
+    refs = set()
+    for ea in get_code_items(func_addr):
+        refs.update(idautils.CodeRefsFrom(ea, 0))
+        refs.update(idautils.DataRefsFrom(ea))
+    for ref in sorted(refs):
+        func_inst = idaapi.get_func(ref)
+        if func_inst and ida_shims.start_ea(func_inst) == func_addr:
+            continue
+        sign.extend([hex(ref), ida_shims.get_name(ref), ida_shims.get_type(ref) or ''])
+    sign.extend(get_user_sign(func_addr))
+    sign.append(get_types_sign())
+    return '\n'.join(sign)
+
+def extract_psdo_record(func_addr):
+    # in-memory handle on the persistent record, names and types are part
+    # of the key since they change the decompiler output; failures are
+    # keyed by the bytes and the prototype only, renaming a callee does
+    # not make the decompiler succeed
+    entry = get_store().get_entry(func_addr)
+    psdo_hash = hashlib.md5((entry['hash'] + get_psdo_sign(func_addr)).encode('utf-8')).hexdigest()
+    fail_sign = ida_shims.get_type(func_addr) or ''
+    fail_hash = hashlib.md5((entry['hash'] + fail_sign).encode('utf-8')).hexdigest()
+    psdo_cache = get_psdo_cache()
+    record = psdo_cache.get(func_addr, psdo_hash) if psdo_cache else None
+    if record is None:
+        record = {'text': None, 'summaries': {}}
+    record['hash'] = psdo_hash
+    record['fail_hash'] = fail_hash
+    record['fail'] = psdo_cache.get_fail(func_addr, fail_hash) if psdo_cache else None
+    return record
+
+def save_psdo_record(func_addr, record):
+    psdo_cache = get_psdo_cache()
+    if psdo_cache:
+        psdo_cache.put(func_addr, record['hash'], record)
+
+def save_psdo_fail(func_addr, record, reason, elapsed):
+    record['fail'] = {'reason': reason, 'elapsed': elapsed}
+    psdo_cache = get_psdo_cache()
+    if psdo_cache:
+        psdo_cache.put_fail(func_addr, record['fail_hash'], record['fail'])
+
+def run_psdo_extract(func_addr, record, extract, default):
+    # decompiler-backed extraction that remembers failing functions, slow
+    # ones are not failures, their output is cached as any other
+    if record['fail'] and PSDO_SKIP_FAILED:
+        return default
+    time_beg = time.time()
+    try:
+        value = extract(func_addr)
+    except idaapi.DecompilationFailure as err:
+        save_psdo_fail(func_addr, record, "failure: {}".format(err), time.time() - time_beg)
+        return default
+    elapsed = time.time() - time_beg
+    if value is None:
+        save_psdo_fail(func_addr, record, "failure: no output", elapsed)
+        return default
+    return value
+
+
+def get_func_bytes(func_addr):
+    return get_store().get_entry(func_addr)['byts']
+
+def get_func_items(func_addr):
+    return get_store().get_feature(func_addr, 'items', extract_items)
+
+def get_code_items(func_addr):
+    return get_store().get_feature(func_addr, 'code', extract_code)
+
+def get_func_heads(func_addr):
+    return get_store().get_feature(func_addr, 'heads', extract_heads)
+
+def get_item_mnems(func_addr):
+    # mnemonics of all function heads, empty ones of data heads included
+    mnem_map = get_store().get_feature(func_addr, 'mnem', extract_mnems)
+    return [mnem_map[ea] for ea in get_func_heads(func_addr)]
+
+def get_mnem_list(func_addr):
+    mnem_map = get_store().get_feature(func_addr, 'mnem', extract_mnems)
+    return [mnem_map[ea] for ea in get_code_items(func_addr)]
+
+def get_dasm_list(func_addr):
+    return get_store().get_feature(func_addr, 'dasm', extract_dasm)
+
+def get_psdo_record(func_addr):
+    return get_store().get_feature(func_addr, 'psdo', extract_psdo_record)
+
+def get_psdo_str(func_addr):
+    record = get_psdo_record(func_addr)
+    if record['text'] is None:
+        psdo_text = run_psdo_extract(func_addr, record, extract_psdo, None)
+        if psdo_text is None:
+            return ""
+        record['text'] = psdo_text
+        save_psdo_record(func_addr, record)
+    return record['text']
+
+def get_psdo_summary(func_addr, name, extract, default=None):
+    """Get a JSON-serializable value derived from the decompiled ctree.
+
+    The value is kept in the pseudocode cache, so 'extract' is called
+    (and the function decompiled) only if it is missing there. 'default'
+    is returned for functions that cannot be decompiled.
+    """
+    record = get_psdo_record(func_addr)
+    if name not in record['summaries']:
+        value = run_psdo_extract(func_addr, record, extract, None)
+        if value is None:
+            return default
+        record['summaries'][name] = value
+        save_psdo_record(func_addr, record)
+    return record['summaries'][name]
+
+def get_psdo_skip(func_addr):
+    """Get the reason a function's pseudocode was skipped, None if it was not."""
+    record = get_psdo_record(func_addr)
+    if record['fail'] is None or not PSDO_SKIP_FAILED:
+        return None
+    return "{} ({:.2f}s)".format(record['fail']['reason'], record['fail']['elapsed'])
+
+def is_psdo_skipped(func_addr, skipped):
+    """Add the function to 'skipped' if its pseudocode was skipped, tell whether it was."""
+    func_skip = get_psdo_skip(func_addr)
+    if func_skip:
+        skipped.append((func_addr, func_skip))
+    return bool(func_skip)
+
+def add_psdo_skipped(report, skipped):
+    # functions the decompiler failed on make a cluster of their own
+    if len(skipped):
+        report['data']['skipped'] = skipped
+        report['stat']['skipped'] = len(skipped)
+
+def get_psdo_calls(func_addr):
+    # JSON has no integer keys, calls are kept as nested pairs
+    def extract(ea):
+        calls = ida_utils.extract_calls_from_decompiled(ea)
+        return [[callee, list(descs.items())] for callee, descs in calls.items()]
+
+    calls = get_psdo_summary(func_addr, 'calls', extract, [])
+    return dict((callee, dict((pos, args) for pos, args in descs)) for callee, descs in calls)
+
+def get_psdo_list(func_addr):
+    func_pseudocode = []
+    for line in get_psdo_str(func_addr).split('\n'):
+        if '//' in line:
+            code = line.split('//')[0]
+            if code != '':
+                func_pseudocode.append(code.lstrip())
+        else:
+            if line != '':
+                func_pseudocode.append(line.lstrip())
+    return func_pseudocode
+
+def get_psdo_body(func_addr):
+    psdo_list = get_psdo_list(func_addr)
+    return psdo_list[2:-1]
+
+def get_flowchart(func_addr, flags=0):
+    feat_name = 'flow_{}'.format(flags)
+    return get_store().get_feature(
+        func_addr, feat_name,
+        lambda ea: idaapi.FlowChart(idaapi.get_func(ea), flags=flags))
@@ -50,6 +50,11 @@ try:
 except ImportError:
     ida_ida = None
 
+try:
+    import ida_typeinf
+except ImportError:
+    ida_typeinf = None
+
 
 def _get_fn_by_version(lib, curr_fn, archive_fn, archive_lib=None):
     '''
@@ -1013,6 +1018,19 @@ def get_func_flags(ea):
     return fn(ea)
 
 
+def get_type(ea):
+    """
+    Get type declaration of the item at 'ea'.
+
+    :param ea: Linear address.
+    :type ea: int
+
+    :return: Type string or None if no type is defined.
+    """
+    fn = _get_fn_by_version(idc, 'get_type', 'GetType')
+    return fn(ea)
+
+
 def get_input_file_path():
     fn = _get_fn_by_version(idaapi, 'get_input_file_path', 'GetInputFilePath', idc)
     return fn()
@@ -1069,3 +1087,16 @@ def inf_get_cc_id():
     else:
         inf = idaapi.get_inf_structure()
         return inf.cc.id
+
+def get_ordinal_limit():
+    # local type ordinals start at 1 and end below the limit
+    if idaapi.IDA_SDK_VERSION >= 900:
+        return ida_typeinf.get_ordinal_limit(None)
+    elif idaapi.IDA_SDK_VERSION >= 700:
+        return ida_typeinf.get_ordinal_qty(None) + 1
+    else:
+        return idc.GetMaxLocalType() + 1
+
+def get_local_type(ordinal):
+    fn = _get_fn_by_version(idc, 'get_local_type', 'GetLocalType')
+    return fn(ordinal, idc.PRTYPE_1LINE | idc.PRTYPE_TYPE)
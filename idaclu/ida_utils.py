@@ -21,6 +21,7 @@ except ImportError:
     pass
 
 from idaclu import ida_shims
+from idaclu import plg_utils
 
 
 def manage_dir(dir_name, operation, is_abs):
@@ -155,9 +156,8 @@ def get_nodes_edges(func_addr):
     node_count = len(list(g))
     edge_count = 0
     for x in g:
-        succ_count = len(list(x.succs()))
-        pred_count = len(list(x.preds()))
-        edge_count += (succ_count + pred_count)
+        # every edge is the successor of exactly one block
+        edge_count += len(list(x.succs()))
     return (node_count, edge_count)
 
 def get_func_ea_by_ref(func_ref):
@@ -168,6 +168,11 @@ def get_func_ea_by_ref(func_ref):
     elif isinstance(func_ref, func_t):
         return func_ref.start_ea
 
+def get_func_start(addr):
+    # an address inside of a function stands for the function
+    func_inst = idaapi.get_func(addr)
+    return ida_shims.start_ea(func_inst) if func_inst else addr
+
 def get_func_item_eas(func_ref):
     func_ea = get_func_ea_by_ref(func_ref)
     for item_ea in list(idautils.FuncItems(func_ea)):
@@ -345,6 +350,117 @@ def is_in_interval(addr, func_ivals, is_strict):
 def get_func_ivals(func_addr):
     return [(func_beg, func_end) for func_beg, func_end in ida_shims.get_chunk_eas(func_addr)]
 
+_seg_caches = {}  # IDB path -> {segment start: (segment end, segment bytes)}
+_seg_hooks = None
+
+class SegmentCacheHooks(idaapi.IDB_Hooks):
+    """Drop cached segment bytes when the database bytes change or it is closed."""
+
+    def __init__(self, idb_path):
+        idaapi.IDB_Hooks.__init__(self)
+        self.idb_path = idb_path
+
+    def byte_patched(self, ea, *args):
+        invalidate_segment_cache(ea)
+        return 0
+
+    def segm_added(self, *args):
+        invalidate_segment_cache()
+        return 0
+
+    def segm_deleted(self, *args):
+        invalidate_segment_cache()
+        return 0
+
+    def segm_moved(self, *args):
+        invalidate_segment_cache()
+        return 0
+
+    def closebase(self, *args):
+        close_segment_cache()
+        return 0
+
+def get_segment_cache():
+    global _seg_hooks
+    idb_path = ida_shims.get_idb_path()
+    if _seg_hooks is None or _seg_hooks.idb_path != idb_path:
+        close_segment_cache()
+        _seg_hooks = SegmentCacheHooks(idb_path)
+        _seg_hooks.hook()
+    return _seg_caches.setdefault(idb_path, {})
+
+def close_segment_cache():
+    # the bytes of the closed database are dropped along with the hooks
+    global _seg_hooks
+    if _seg_hooks is not None:
+        _seg_hooks.unhook()
+        _seg_caches.pop(_seg_hooks.idb_path, None)
+        _seg_hooks = None
+
+def invalidate_segment_cache(ea=None):
+    seg_cache = _seg_caches.get(ida_shims.get_idb_path())
+    if seg_cache is None:
+        return
+    if ea is None:
+        seg_cache.clear()
+        return
+    for seg_beg, (seg_end, _) in list(seg_cache.items()):
+        if seg_beg <= ea < seg_end:
+            del seg_cache[seg_beg]
+
+def get_segment_buffer(ea):
+    """Get (segment start, memoryview of the segment bytes) of the segment at ea.
+
+    Each segment is read from the database once, (None, None) is returned
+    for addresses outside of the segments.
+    """
+    seg_cache = get_segment_cache()
+    seg_beg = ida_shims.get_segm_start(ea)
+    if seg_beg == idaapi.BADADDR:
+        return None, None
+    if seg_beg not in seg_cache:
+        seg_end = ida_shims.get_segm_end(ea)
+        seg_data = ida_shims.get_bytes(seg_beg, seg_end - seg_beg) or b''
+        seg_cache[seg_beg] = (seg_end, memoryview(bytearray(seg_data)))
+    return seg_beg, seg_cache[seg_beg][1]
+
+def get_range_bytes(beg, end):
+    seg_beg, seg_view = get_segment_buffer(beg)
+    if seg_view is None or end - seg_beg > len(seg_view):
+        return memoryview(ida_shims.get_bytes(beg, end - beg) or b'')
+    return seg_view[beg - seg_beg:end - seg_beg]
+
+def get_func_bytes(func_addr):
+    """Get a memoryview of the bytes of all function chunks.
+
+    A single-chunk function is a view into the cached segment bytes,
+    the chunks of a non-contiguous one are joined into a single buffer.
+    """
+    chunk_views = [get_range_bytes(beg, end) for beg, end in idautils.Chunks(func_addr)]
+    if len(chunk_views) == 1:
+        return chunk_views[0]
+    return memoryview(b''.join(chunk_views))
+
+def write_segment_snapshot(func_addrs):
+    """Snapshot the bytes of the functions for worker processes.
+
+    Only the segments the functions lie in are written, see
+    plg_utils.write_snapshot() for the descriptor returned.
+    """
+    seg_views = {}
+    func_chunks = []
+    for func_addr in func_addrs:
+        chunks = []
+        for beg, end in idautils.Chunks(func_addr):
+            seg_beg, seg_view = get_segment_buffer(beg)
+            if seg_view is None or end - seg_beg > len(seg_view):
+                # bytes outside of the segments are a piece of their own
+                seg_beg, seg_view = beg, get_range_bytes(beg, end)
+            seg_views[seg_beg] = seg_view
+            chunks.append((beg, end))
+        func_chunks.append((func_addr, chunks))
+    return plg_utils.write_snapshot(sorted(seg_views.items()), func_chunks)
+
 def get_chunk_count(func_addr):
     num_chunks = len(get_func_ivals(func_addr))
     return num_chunks
@@ -30,12 +30,13 @@ from idaclu.qt_shims import (
     QVBoxLayout,
     QWidget
 )
+from idaclu import feature_store
 from idaclu import ida_utils
 from idaclu import plg_utils
 from idaclu.ui_idaclu import Ui_PluginDialog
 from idaclu.qt_utils import i18n
 from idaclu.qt_widgets import FrameLayout
-from idaclu.models import ResultModel, ResultNode
+from idaclu.models import ClusterNode, ResultModel
 from idaclu.assets import resource
 
 # new backward-incompatible modules
@@ -45,13 +46,21 @@ except ImportError:
     pass
 
 
+FUNC_TIME_BUDGET = 10.0  # seconds a sub-plugin may spend on a single function
+
+
 class InstrumentedCallback:
-    """A wrapper class to count accesses to a callback."""
+    """A wrapper class to count accesses to a callback.
 
-    def __init__(self, func, pass_count=0):
+    With a non-zero pass count the callback gets the current pass and
+    the pass count, otherwise the caller's own arguments are passed on.
+    """
+
+    def __init__(self, func, pass_count=0, time_hook=None):
         self.func = func
         self.pass_count = pass_count
         self.call_count = 0
+        self.time_hook = time_hook
 
     def reset(self):
         self.call_count = 0
@@ -60,13 +69,20 @@ class InstrumentedCallback:
         self.call_count += 1
 
         if self.pass_count == 0:
-            return self.func()
+            return self.func(*args)
         else:
+            # undeclared extra passes stretch the progress instead of overflowing it
+            self.pass_count = max(self.pass_count, self.call_count)
             return self.func(self.call_count, self.pass_count)
 
     def get_call_count(self):
         return self.call_count
 
+    def record_time(self, func_addr, func_time):
+        # for sub-plugins that work on the functions after iterating them
+        if self.time_hook:
+            self.time_hook(func_addr, func_time)
+
 
 class AppendTextEditDelegate(QStyledItemDelegate):
     def createEditor(self, parent, option, index):
@@ -110,6 +126,9 @@ class IdaCluDialog(QWidget):
         self.sel_prfx = []
         self.sel_colr = []
 
+        self.func_budget = FUNC_TIME_BUDGET
+        self.over_budget = collections.OrderedDict()
+
         sp_path = self.get_splg_root(self.env_desc.plg_src, 'idaclu')
         for frame in self.get_sp_controls(sp_path):
             self.ui.ScriptsContentsLayout.addWidget(frame)
@@ -198,10 +217,6 @@ class IdaCluDialog(QWidget):
                     widget.deleteLater()
                 del item
 
-    def sample_generator(self):
-        if False:
-            yield
-
     def has_parent_widget(self, sender_button, dropdown_class):
         parent_widget = sender_button.parent()
         for i in range(parent_widget.layout().count()):
@@ -231,6 +246,7 @@ class IdaCluDialog(QWidget):
             script_type = getattr(module, 'SCRIPT_TYPE', 'custom')
             script_view = getattr(module, 'SCRIPT_VIEW', 'table')
             script_args = getattr(module, 'SCRIPT_ARGS', [])
+            script_passes = getattr(module, 'SCRIPT_PASSES', 1)
 
             if not script_type in ['func', 'custom']:
                 ida_shims.msg('ERROR: Unknown plugin type')
@@ -330,11 +346,22 @@ class IdaCluDialog(QWidget):
 
                 get_cs_data = getattr(module, 'get_data')
 
-                gen = InstrumentedCallback(self.sample_generator)
-                get_cs_data(gen, self.env_desc, plug_params)
-                phase_count = gen.get_call_count()
-                gen = InstrumentedCallback(func_filter, phase_count)
-                cs_data = get_cs_data(gen, self.env_desc, plug_params)
+                # 'func' scripts declare how many times they iterate over functions,
+                # 'custom' ones report their progress themselves
+                gen = InstrumentedCallback(func_filter, script_passes if is_pre_filter else 0, self.recordFuncTime)
+                self.func_budget = getattr(module, 'SCRIPT_BUDGET', FUNC_TIME_BUDGET)
+                self.over_budget.clear()
+                try:
+                    cs_data = get_cs_data(gen, self.env_desc, plug_params)
+                finally:
+                    # keep what was decompiled even if the run was cancelled
+                    feature_store.flush()
+
+                if len(self.over_budget):
+                    cs_data['over budget'] = [
+                        (func_addr, "{:.2f}s".format(func_time))
+                        for func_addr, func_time in self.over_budget.items()
+                    ]
 
                 if self.ui.ConfigTool.is_save:
                     with open(cs_cache_file, "w") as json_file:
@@ -356,6 +383,7 @@ class IdaCluDialog(QWidget):
             #  - the "hook" - is function address (with optional comment)
             # The aim to augment "hooks" with useful for analysis data
             # to be presented in main tree-table view of the plugin.
+            func_table = feature_store.get_func_table(self.env_desc.feat_folders)
             for band_nam in cs_data:
                 for hook_val in cs_data[band_nam]:
                     func_addr, func_cmnt = None, None
@@ -370,32 +398,13 @@ class IdaCluDialog(QWidget):
                     if (self.ui.ConfigTool.is_save or is_pre_filter == False) and self.isFuncRelevant(func_addr) == False:
                         continue
 
-                    # Getting function info from function "hook".
-                    func_inst = idaapi.get_func(func_addr)
-                    func_name = ida_shims.get_func_name(func_addr)
-                    func_colr = plg_utils.RgbColor(ida_shims.get_color(func_addr, idc.CIC_FUNC))
-                    func_colr.invert_color()
-                    func_path = None
-                    func_node, func_edge = ida_utils.get_nodes_edges(func_addr)
-
-                    # Storing function data.
-                    func_desc = collections.OrderedDict()
-                    func_desc['func_name'] = func_name
-
-                    if self.env_desc.feat_folders:
-                        dir_info = self.clu_data['dirs']
-                        func_path = dir_info[func_addr] if func_addr in dir_info else '/'
-                        func_desc['func_path'] = func_path
-
-                    func_desc['func_addr'] = hex(func_addr)
-                    func_desc['func_size'] = ida_shims.calc_func_size(func_inst)
-                    func_desc['func_chnk'] = len(list(idautils.Chunks(func_addr)))
-                    func_desc['func_node'] = func_node  # graph node count
-                    func_desc['func_edge'] = func_edge  # graph edge count
-                    func_desc['func_cmnt'] = func_cmnt
-                    func_desc['func_colr'] = func_colr.get_to_str()
-
-                    cp_data[band_nam].append(func_desc)
+                    # Rows keep the reported addresses, the columns are read
+                    # from the function metrics table once they are shown.
+                    func_id = func_table.get_id(func_addr, is_graph=False)
+                    if func_id is None:
+                        continue
+                    cp_data[band_nam].append((func_addr, func_table.addrs[func_id], func_cmnt))
+
                     cs_func_idx += 1
                     # Augmenting function data is represented as 15% of progress.
                     cs_prog = plg_utils.get_prog_val(50, 15, cs_func_idx, cs_func_count)
@@ -404,13 +413,17 @@ class IdaCluDialog(QWidget):
             # Constructing list of node trees.
             # The list contains only parent nodes, that internally have references to child nodes.
             cs_func_idx = 0
-            for band_idx, (band_nam, func_dss) in enumerate(cp_data.items()):
-                self.items.append(ResultNode("{} ({})".format(band_nam, len(func_dss))))
-                for func_idx, func_dsc in enumerate(func_dss):
-                    self.items[-1].addChild(ResultNode(list(func_dsc.values())))
+            col_count = len(self.ui.rvTable.heads)
+            for band_idx, (band_nam, func_rows) in enumerate(cp_data.items()):
+                func_addrs = plg_utils.get_offset_array(func_addr for func_addr, _, _ in func_rows)
+                func_cmnts = [func_cmnt for _, _, func_cmnt in func_rows]
+                self.items.append(ClusterNode(
+                    band_nam, func_addrs, func_cmnts, self.getFuncRow, self.getFuncCell, col_count))
+                # records are indexed by the function start
+                for func_idx, (_, func_start, _) in enumerate(func_rows):
                     cs_func_idx += 1
                     finished = plg_utils.get_prog_val(65, 30, cs_func_idx, cs_func_count)
-                    self.ui.rvTable.rec_indx[int(func_dsc['func_addr'], 16)].append((band_idx, func_idx))
+                    self.ui.rvTable.rec_indx[func_start].append((band_idx, func_idx))
                     self.ui.wProgressBar.updateProgress(finished, "Phase: indexing")
 
             self.ui.rvTable.setModelProxy(ResultModel(self.ui.rvTable.heads, self.items, self.env_desc))
@@ -419,6 +432,58 @@ class IdaCluDialog(QWidget):
         except plg_utils.UserCancelledError:
             return
 
+    def getFuncRow(self, func_addr, func_cmnt):
+        # the reported address is shown, the rest is read from the function
+        # containing it, which may have changed since the run
+        func_table = feature_store.get_func_table(self.env_desc.feat_folders)
+        func_id = func_table.get_id(func_addr)
+        if func_id is None:
+            func_row = [None] * len(self.ui.rvTable.heads)
+            func_row[self.ui.rvTable.heads.index('Address')] = func_addr
+            return func_row
+
+        func_colr = plg_utils.RgbColor(func_table.colors[func_id])
+        func_colr.invert_color()
+
+        func_row = [func_table.names[func_id]]
+        if self.env_desc.feat_folders:
+            func_row.append(func_table.folders[func_id])
+        func_row.extend([
+            func_addr,
+            func_table.sizes[func_id],
+            func_table.chunks[func_id],
+            func_table.nodes[func_id],  # graph node count
+            func_table.edges[func_id],  # graph edge count
+            func_cmnt,
+            func_colr.get_to_int()
+        ])
+        return func_row
+
+    def getFuncCell(self, func_addr, func_cmnt, col):
+        # a single column, the flow graph is only counted for its own columns
+        head = self.ui.rvTable.heads[col]
+        if head == 'Comment':
+            return func_cmnt
+        if head == 'Address':
+            return func_addr
+        func_table = feature_store.get_func_table(self.env_desc.feat_folders)
+        func_id = func_table.get_id(func_addr, is_graph=head in ('Nodes', 'Edges'))
+        if func_id is None:
+            return None
+        if head == 'Color':
+            func_colr = plg_utils.RgbColor(func_table.colors[func_id])
+            func_colr.invert_color()
+            return func_colr.get_to_int()
+        func_cols = {
+            'Name': func_table.names,
+            'Folder': func_table.folders,
+            'Size': func_table.sizes,
+            'Chunks': func_table.chunks,
+            'Nodes': func_table.nodes,
+            'Edges': func_table.edges
+        }
+        return func_cols[head][func_id]
+
     def prepareView(self):
         view = self.ui.rvTable
         rvTableSelModel = view.selectionModel()
@@ -477,7 +542,16 @@ class IdaCluDialog(QWidget):
             except plg_utils.UserCancelledError:
                 raise plg_utils.UserCancelledError
 
+            # time spent by the sub-plugin until it asks for the next function,
+            # every pass gets all the functions, the slow ones included
+            time_beg = time.time()
             yield func_addr
+            self.recordFuncTime(func_addr, time.time() - time_beg)
+
+    def recordFuncTime(self, func_addr, func_time):
+        # the longest a function took in any of the passes
+        if func_time > max(self.func_budget, self.over_budget.get(func_addr, 0.0)):
+            self.over_budget[func_addr] = func_time
 
     def isFuncRelevant(self, func_addr):
         # function directories
@@ -485,8 +559,12 @@ class IdaCluDialog(QWidget):
             if not (func_addr in self.clu_data['dirs'] and
                 self.clu_data['dirs'][func_addr] in self.sel_dirs):
                 return False
+        func_table = feature_store.get_func_table(self.env_desc.feat_folders)
+        func_id = func_table.get_id(func_addr, is_graph=False)
+        if func_id is None:
+            return False
         # function name prefixes
-        func_name = ida_shims.get_func_name(func_addr)
+        func_name = func_table.names[func_id]
         func_prfx = ida_utils.get_func_prefs(func_name, True)
         if len(self.sel_prfx) and self.sel_prfx[0] != '':
             if self.ui.wPrefixFilter.getState() == True:
@@ -496,7 +574,7 @@ class IdaCluDialog(QWidget):
                 if not any(p in self.sel_prfx for p in func_prfx):
                     return False
         # function highlight color
-        func_colr = plg_utils.RgbColor(ida_shims.get_color(func_addr, idc.CIC_FUNC))
+        func_colr = plg_utils.RgbColor(func_table.colors[func_id])
         func_colr.invert_color()
 
         if len(self.sel_colr) and self.sel_colr[0] != '':
@@ -547,38 +625,33 @@ class IdaCluDialog(QWidget):
                 'add': collections.defaultdict(int),
             }
 
-            model = self.ui.rvTable.model()
+            if label_mode not in ('prefix', 'folder'):
+                ida_shims.msg('ERROR: unknown label mode')
+                return
+
             name_col = self.ui.rvTable.heads.index('Name')
             fldr_col = self.ui.rvTable.heads.index('Folder')
 
+            # the database is changed once per function, then all its rows
             for func_addr in addr_queue:
                 func_name = ida_shims.get_func_name(func_addr)
-                for id_group, id_child in self.ui.rvTable.rec_indx[func_addr]:
-                    if label_mode == 'prefix':
-                        if not re.match("{0}%|{0}_".format(label_norm[:-1]), func_name):
-                            func_name_new = plg_utils.add_prefix(func_name, label_norm, False)
-                            ida_shims.set_name(func_addr, func_name_new, idaapi.SN_CHECK)
-                            indx_child = model.index(id_child, name_col, model.index(id_group, 0))
-                            model.layoutAboutToBeChanged.emit()
-                            model.setData(indx_child, func_name_new)
-                            model.layoutChanged.emit()
-                            for tkn in label_norm.split('_'):
-                                if tkn != '':
-                                    changelog['add'][tkn] += 1
-                    elif label_mode == 'folder':
-                        folder_src = self.clu_data['dirs'].get(func_addr, '/')
-                        if label_norm != folder_src:
-                            self.clu_data['dirs'][func_addr] = label_norm
-                            changelog['sub'][folder_src] += 1
-                            changelog['add'][label_norm] += 1
-                            ida_utils.set_func_folder(func_addr, folder_src, label_norm)
-                            indx_child = model.index(id_child, fldr_col, model.index(id_group, 0))
-                            model.layoutAboutToBeChanged.emit()
-                            model.setData(indx_child, label_norm)
-                            model.layoutChanged.emit()
-                    else:
-                        ida_shims.msg('ERROR: unknown label mode')
-                        return
+                if label_mode == 'prefix':
+                    if not re.match("{0}%|{0}_".format(label_norm[:-1]), func_name):
+                        func_name_new = plg_utils.add_prefix(func_name, label_norm, False)
+                        ida_shims.set_name(func_addr, func_name_new, idaapi.SN_CHECK)
+                        self.setFuncRecords(func_addr, name_col, func_name_new)
+                        for tkn in label_norm.split('_'):
+                            if tkn != '':
+                                changelog['add'][tkn] += 1
+                elif label_mode == 'folder':
+                    folder_src = self.clu_data['dirs'].get(func_addr, '/')
+                    if label_norm != folder_src:
+                        self.clu_data['dirs'][func_addr] = label_norm
+                        feature_store.get_func_table(True).set_folder(func_addr, label_norm)
+                        changelog['sub'][folder_src] += 1
+                        changelog['add'][label_norm] += 1
+                        ida_utils.set_func_folder(func_addr, folder_src, label_norm)
+                        self.setFuncRecords(func_addr, fldr_col, label_norm)
 
             if len(changelog['sub']) or len(changelog['add']):
                 self.updateFilters(label_mode, changelog)
@@ -594,41 +667,36 @@ class IdaCluDialog(QWidget):
                 'add': collections.defaultdict(int),
             }
 
-            model = self.ui.rvTable.model()
+            label_mode = self.ui.wLabelTool.getLabelMode()
+            if label_mode not in ('prefix', 'folder'):
+                ida_shims.msg('ERROR: unknown label mode')
+                return
+
             name_col = self.ui.rvTable.heads.index('Name')
             fldr_col = self.ui.rvTable.heads.index('Folder')
 
-            for idx, addr_field in enumerate(set(data)):
-                func_addr = int(addr_field, base=16)
+            # the database is changed once per function, then all its rows
+            func_addrs = set(ida_utils.get_func_start(int(field, base=16)) for field in data)
+            for idx, func_addr in enumerate(func_addrs):
                 func_name = ida_shims.get_func_name(func_addr)
-                for id_group, id_child in self.ui.rvTable.rec_indx[func_addr]:
-                    label_mode = self.ui.wLabelTool.getLabelMode()
-                    if label_mode == 'prefix':
-                        func_prefs = ida_utils.get_func_prefs(func_name, True)
-                        last_pref = func_prefs[0]
-                        if len(func_prefs) >= 1 and last_pref != 'sub':
-                            func_name_new = re.sub('{0}%|{0}_'.format(last_pref), '', func_name, 1)
-                            # cleanup in case of next bad prefix in front
-                            func_name_new = ida_utils.get_cleaned_funcname(func_name_new)
-                            ida_shims.set_name(func_addr, func_name_new, idaapi.SN_NOWARN)
-                            indx_child = model.index(id_child, name_col, model.index(id_group, 0))
-                            model.layoutAboutToBeChanged.emit()
-                            model.setData(indx_child, func_name_new)
-                            model.layoutChanged.emit()
-                            changelog['sub'][last_pref] += 1
-                    elif label_mode == 'folder':
-                        func_fldr = self.clu_data['dirs'].get(func_addr, '/')
-                        changelog['sub'][func_fldr] += 1
-                        changelog['add']['/'] += 1
-                        ida_utils.set_func_folder(func_addr, func_fldr, '/')
-                        indx_child = model.index(id_child, fldr_col, model.index(id_group, 0))
-                        model.layoutAboutToBeChanged.emit()
-                        model.setData(indx_child, '/')
-                        model.layoutChanged.emit()
-                        self.clu_data['dirs'][func_addr] = '/'
-                    else:
-                        ida_shims.msg('ERROR: unknown label mode')
-                        return
+                if label_mode == 'prefix':
+                    func_prefs = ida_utils.get_func_prefs(func_name, True)
+                    last_pref = func_prefs[0]
+                    if len(func_prefs) >= 1 and last_pref != 'sub':
+                        func_name_new = re.sub('{0}%|{0}_'.format(last_pref), '', func_name, 1)
+                        # cleanup in case of next bad prefix in front
+                        func_name_new = ida_utils.get_cleaned_funcname(func_name_new)
+                        ida_shims.set_name(func_addr, func_name_new, idaapi.SN_NOWARN)
+                        self.setFuncRecords(func_addr, name_col, func_name_new)
+                        changelog['sub'][last_pref] += 1
+                elif label_mode == 'folder':
+                    func_fldr = self.clu_data['dirs'].get(func_addr, '/')
+                    changelog['sub'][func_fldr] += 1
+                    changelog['add']['/'] += 1
+                    ida_utils.set_func_folder(func_addr, func_fldr, '/')
+                    self.setFuncRecords(func_addr, fldr_col, '/')
+                    self.clu_data['dirs'][func_addr] = '/'
+                    feature_store.get_func_table(True).set_folder(func_addr, '/')
             self.updateFilters(label_mode, changelog)
             if self.env_desc.ver_py > 2:
                 ida_utils.refresh_ui()
@@ -673,25 +741,29 @@ class IdaCluDialog(QWidget):
                 'add': collections.defaultdict(int),
             }
 
-            model = self.ui.rvTable.model()
             id_col = self.ui.rvTable.heads.index('Color')
 
+            # the database is changed once per function, then all its rows
             for func_addr in addr_queue:
-                for id_group, id_child in self.ui.rvTable.rec_indx[func_addr]:
-                    color_get = plg_utils.RgbColor(ida_shims.get_color(func_addr, idc.CIC_FUNC))
-                    color_get.invert_color()
-                    ida_shims.set_color(func_addr, idc.CIC_FUNC, color_set.get_to_int(True))
-                    indx_child = model.index(id_child, id_col, model.index(id_group, 0))
-                    model.layoutAboutToBeChanged.emit()
-                    model.setData(indx_child, color_set.get_to_str())
-                    model.layoutChanged.emit()
-
-                    changelog['sub'][color_get.get_to_name()] += 1
-                    changelog['add'][color_set.get_to_name()] += 1
+                color_get = plg_utils.RgbColor(ida_shims.get_color(func_addr, idc.CIC_FUNC))
+                color_get.invert_color()
+                ida_shims.set_color(func_addr, idc.CIC_FUNC, color_set.get_to_int(True))
+                self.setFuncRecords(func_addr, id_col, color_set.get_to_int())
+
+                changelog['sub'][color_get.get_to_name()] += 1
+                changelog['add'][color_set.get_to_name()] += 1
             self.updateFilters('color', changelog)
             if self.env_desc.ver_py > 2:
                 ida_utils.refresh_ui()
 
+    def setFuncRecords(self, func_addr, col, value):
+        # every row of the function, also the filtered and the not fetched ones
+        model = self.ui.rvTable.model().sourceModel()
+        model.layoutAboutToBeChanged.emit()
+        for id_group, id_child in self.ui.rvTable.rec_indx[func_addr]:
+            model.setRowData(model.index(id_group, 0), id_child, col, value)
+        model.layoutChanged.emit()
+
     def getLabelAddrSet(self):
         id_col = self.ui.rvTable.heads.index('Address')
         indexes = [idx for idx in self.ui.rvTable.selectionModel().selectedRows()]
@@ -699,7 +771,7 @@ class IdaCluDialog(QWidget):
 
         addr_queue = set()
         for idx, field in enumerate(fields):
-            func_addr = int(field, base=16)
+            func_addr = ida_utils.get_func_start(int(field, base=16))
             addr_queue.add(func_addr)
 
         addr_calees = set()
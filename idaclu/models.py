@@ -1,5 +1,8 @@
+import array
+import collections
 from re import split
 
+from idaclu import plg_utils
 from idaclu.qt_shims import (
     QAbstractItemModel,
     QBrush,
@@ -10,7 +13,62 @@ from idaclu.qt_shims import (
 )
 
 
+RESULT_FETCH_BATCH = 1000  # rows of an expanded cluster made into nodes at once
+NONE_VALUE = -2 ** 63  # stands for None in the integer columns
+
+
+_color_strs = {}
+_count_strs = {}
+_color_brushes = {}
+
+def get_color_brush(value, lib_qt):
+    # a single background object per packed 0xRRGGBB color
+    brush = _color_brushes.get(value)
+    if brush is None:
+        color = QColor((value >> 16) & 255, (value >> 8) & 255, value & 255)
+        brush = color if lib_qt == 'pyqt5' else QBrush(color)
+        _color_brushes[value] = brush
+    return brush
+
+def format_color(value):
+    # packed 0xRRGGBB
+    color_str = _color_strs.get(value)
+    if color_str is None:
+        color_str = "rgb({},{},{})".format((value >> 16) & 255, (value >> 8) & 255, value & 255)
+        _color_strs[value] = color_str
+    return color_str
+
+def format_count(value):
+    # counts repeat a lot across rows, each is a single shared string
+    count_str = _count_strs.get(value)
+    if count_str is None:
+        count_str = str(value)
+        _count_strs[value] = count_str
+    return count_str
+
+def format_name(value):
+    return value.replace('%', '_')
+
+# display formats of the typed columns, the rest is shown with str()
+HEAD_FORMATS = {
+    'Name': format_name,
+    'Address': hex,
+    'Size': format_count,
+    'Chunks': format_count,
+    'Nodes': format_count,
+    'Edges': format_count,
+    'Color': format_color
+}
+
+
 class ResultNode(object):
+    """A tree node of column values, the root and the cluster headings.
+
+    The node knows its own row in the parent.
+    """
+
+    __slots__ = ('_data', '_col_count', '_children', '_parent', '_row')
+
     def __init__(self, data, parent=None):
         if isinstance(data, tuple):
             self._data = list(data)
@@ -23,13 +81,18 @@ class ResultNode(object):
         self._col_count = len(self._data)
         self._children = []
         self._parent = parent
+        self._row = 0
 
-    def data(self, col):
+    def data(self, col, fmt=str):
         # len(self._data) - actual column count
         # self.columnCount() - column allocation for the node
         if 0 <= col < len(self._data):
             _data = self._data[col]
-            return str(_data) if _data != None else ""
+            return fmt(_data) if _data != None else ""
+
+    def value(self, col):
+        if 0 <= col < len(self._data):
+            return self._data[col]
 
     def columnCount(self):
         return self._col_count
@@ -45,19 +108,219 @@ class ResultNode(object):
         return self._parent
 
     def row(self):
-        return self.childCount()
+        return self._row
 
     def addChild(self, child):
         child._parent = self
+        child._row = len(self._children)
         self._children.append(child)
         self._col_count = max(child.columnCount(), self._col_count)
 
+    def sortChildren(self, key, reverse=False):
+        self._children.sort(key=key, reverse=reverse)
+        for row, child in enumerate(self._children):
+            child._row = row
+
     def setData(self, col, val):
         if 0 <= col < len(self._data):
             self._data[col] = val
             return True
         return False
 
+
+class ClusterNode(ResultNode):
+    """A cluster keeping the values of its rows in columns, rows have no nodes.
+
+    Rows are function addresses and comments until fetched, 'read_row'
+    turns them into the column values of a fetched row and 'read_cell'
+    reads a single column of a row that was not fetched yet, so that
+    sorting and filtering do not build whole rows. Display strings of the
+    fetched rows are made on the first request and kept until the value
+    changes. Columns of integers (addresses, sizes, counts, colors) are
+    kept in arrays, a column turns into a list on the first value of
+    another type.
+    """
+
+    __slots__ = ('func_addrs', 'func_cmnts', 'read_row', 'read_cell', 'cols', 'disps')
+
+    def __init__(self, name, func_addrs, func_cmnts, read_row, read_cell, col_count=1):
+        super(ClusterNode, self).__init__("{} ({})".format(name, len(func_addrs)))
+        self.func_addrs = func_addrs
+        self.func_cmnts = func_cmnts
+        self.read_row = read_row
+        self.read_cell = read_cell
+        self._col_count = max(col_count, self._col_count)
+        self.cols = [[] for _ in range(self._col_count)]  # values of the fetched rows
+        self.disps = [[] for _ in range(self._col_count)]  # their display strings
+
+    def childCount(self):
+        return len(self.cols[0])
+
+    def child(self, row):
+        return None
+
+    def rowTotal(self):
+        return len(self.func_addrs)
+
+    def canFetchMore(self):
+        return self.childCount() < self.rowTotal()
+
+    def fetchMore(self, count):
+        beg = self.childCount()
+        end = min(beg + count, self.rowTotal())
+        rows_data = [self.read_row(self.func_addrs[row], self.func_cmnts[row]) for row in range(beg, end)]
+        for col in range(len(self.cols)):
+            self.extendValues(col, [row_data[col] if col < len(row_data) else None for row_data in rows_data])
+        for disps in self.disps:
+            disps.extend([None] * (end - beg))
+
+    def getArray(self, col):
+        # a column of no values yet may become an array, None if it may not
+        values = self.cols[col]
+        if isinstance(values, array.array):
+            return values
+        if not len(values):
+            return plg_utils.get_offset_array()
+        return None
+
+    def getList(self, col):
+        values = self.cols[col]
+        if isinstance(values, array.array):
+            values = [None if v == NONE_VALUE else v for v in values]
+        return values
+
+    def extendValues(self, col, new_values):
+        values = self.getArray(col)
+        if values is not None and NONE_VALUE not in new_values:
+            items = new_values
+            if None in items:
+                items = [NONE_VALUE if v is None else v for v in items]
+            try:
+                # made apart first, a failed extend keeps what it added
+                values.extend(array.array(values.typecode, items))
+                self.cols[col] = values
+                return
+            except (TypeError, OverflowError):
+                pass
+        self.cols[col] = self.getList(col)
+        self.cols[col].extend(new_values)
+
+    def putValue(self, col, row, value):
+        values = self.getArray(col)
+        if values is not None and value != NONE_VALUE:
+            try:
+                values[row] = NONE_VALUE if value is None else value
+                self.cols[col] = values
+                return
+            except (TypeError, OverflowError):
+                pass
+        self.cols[col] = self.getList(col)
+        self.cols[col][row] = value
+
+    def getValue(self, col, row):
+        values = self.cols[col]
+        if isinstance(values, array.array) and values[row] == NONE_VALUE:
+            return None
+        return values[row]
+
+    def rowValue(self, row, col):
+        if row < self.childCount():
+            return self.getValue(col, row)
+        return self.read_cell(self.func_addrs[row], self.func_cmnts[row], col)
+
+    def rowData(self, row, col, fmt=str):
+        if row < self.childCount():
+            disp = self.disps[col][row]
+            if disp is None:
+                _data = self.getValue(col, row)
+                disp = fmt(_data) if _data != None else ""
+                self.disps[col][row] = disp
+            return disp
+        _data = self.read_cell(self.func_addrs[row], self.func_cmnts[row], col)
+        return fmt(_data) if _data != None else ""
+
+    def setRowData(self, row, col, val):
+        # rows not fetched yet are read again when needed
+        if row < self.childCount():
+            self.putValue(col, row, val)
+            self.disps[col][row] = None
+            return True
+        return False
+
+    def sortRows(self, key, reverse=False):
+        # 'key' gets a row index, values of the fetched rows are reused
+        order = sorted(range(self.rowTotal()), key=key, reverse=reverse)
+        fetched = self.childCount()
+        self.func_addrs = array.array(self.func_addrs.typecode, [self.func_addrs[row] for row in order])
+        self.func_cmnts = [self.func_cmnts[row] for row in order]
+        kept = 0
+        while kept < fetched and order[kept] < fetched:
+            kept += 1
+        self.cols = [
+            array.array(values.typecode, [values[row] for row in order[:kept]])
+            if isinstance(values, array.array) else [values[row] for row in order[:kept]]
+            for values in self.cols
+        ]
+        self.disps = [[disps[row] for row in order[:kept]] for disps in self.disps]
+        # as many rows stay fetched, the rest of them are read as whole rows
+        self.fetchMore(fetched - kept)
+
+
+class ColumnIndex(object):
+    """Lowercase display strings of a column across the rows of all clusters.
+
+    Rows are numbered through the clusters in their current order, the
+    ones not fetched yet included. Substrings of at least three characters
+    are looked up in a trigram index built on the first such search.
+    """
+
+    def __init__(self, model, col):
+        self.offsets = []  # number of the first row of each cluster
+        self.texts = []
+        self.heads = []  # cluster labels
+        self.trigrams = None
+        root_idx = QModelIndex()
+        for clu_row in range(model.rowCount(root_idx)):
+            clu_idx = model.index(clu_row, 0, root_idx)
+            self.offsets.append(len(self.texts))
+            self.heads.append(model.rowData(root_idx, clu_row, col).lower())
+            self.texts.extend(model.rowData(clu_idx, row, col).lower()
+                              for row in range(model.rowTotal(clu_idx)))
+        self.offsets.append(len(self.texts))
+
+    def getTrigrams(self):
+        if self.trigrams is None:
+            trigrams = collections.defaultdict(list)
+            for row, text in enumerate(self.texts):
+                for gram in set(text[i:i + 3] for i in range(len(text) - 2)):
+                    trigrams[gram].append(row)
+            self.trigrams = dict(trigrams)
+        return self.trigrams
+
+    def find(self, text, rows=None):
+        """Get the sorted numbers of the rows containing 'text', of 'rows' only if given."""
+        if rows is None and len(text) >= 3:
+            trigrams = self.getTrigrams()
+            grams = sorted((trigrams.get(text[i:i + 3], ()) for i in range(len(text) - 2)), key=len)
+            rows = set(grams[0])
+            for gram_rows in grams[1:]:
+                if not rows:
+                    break
+                rows.intersection_update(gram_rows)
+            rows = sorted(rows)
+        elif rows is None:
+            rows = range(len(self.texts))
+        texts = self.texts
+        return [row for row in rows if text in texts[row]]
+
+    def setText(self, clu_row, row, text):
+        self.texts[self.offsets[clu_row] + row] = text.lower()
+        self.trigrams = None
+
+    def getRow(self, clu_row, row):
+        return self.offsets[clu_row] + row
+
+
 class ResultModel(QAbstractItemModel):
 
     def __init__(self, heads, nodes, env_desc):
@@ -65,13 +328,74 @@ class ResultModel(QAbstractItemModel):
         self.env = env_desc
         self.iroot = ResultNode([])
         self.heads = heads
+        self.fmts = [HEAD_FORMATS.get(head, str) for head in heads]
         self.bg_col = heads.index('Color') if 'Color' in heads else None
+        self.col_indexes = {}
+        self.index_epoch = 0  # changes whenever indexed texts do
         for node in nodes:
             self.iroot.addChild(node)
 
     def rowCount(self, parent_idx=QModelIndex()):
         parent_item = self.getItem(parent_idx)
-        return parent_item.childCount()
+        return parent_item.childCount() if parent_item else 0
+
+    def rowTotal(self, parent_idx=QModelIndex()):
+        # rows of the cluster including the ones not fetched yet
+        parent_item = self.getItem(parent_idx)
+        if isinstance(parent_item, ClusterNode):
+            return parent_item.rowTotal()
+        return self.rowCount(parent_idx)
+
+    def rowData(self, parent_idx, row, col):
+        parent_item = self.getItem(parent_idx)
+        if isinstance(parent_item, ClusterNode):
+            return parent_item.rowData(row, col, self.fmts[col])
+        return parent_item.child(row).data(col, self.fmts[col]) or ""
+
+    def rowValue(self, parent_idx, row, col):
+        parent_item = self.getItem(parent_idx)
+        if isinstance(parent_item, ClusterNode):
+            return parent_item.rowValue(row, col)
+        return parent_item.child(row).value(col)
+
+    def setRowData(self, parent_idx, row, col, value):
+        # rows not fetched yet are read again on fetch, only their indexed text is kept
+        if row < self.rowCount(parent_idx):
+            return self.setData(self.index(row, col, parent_idx), value)
+        col_index = self.col_indexes.get(col)
+        if col_index:
+            col_index.setText(parent_idx.row(), row, self.fmts[col](value) if value != None else "")
+            self.index_epoch += 1
+        return True
+
+    def getColumnIndex(self, col):
+        if col not in self.col_indexes:
+            self.col_indexes[col] = ColumnIndex(self, col)
+        return self.col_indexes[col]
+
+    def invalidateIndex(self):
+        # row numbers change with the order of clusters and rows
+        self.col_indexes.clear()
+        self.index_epoch += 1
+
+    def hasChildren(self, parent_idx=QModelIndex()):
+        return self.rowTotal(parent_idx) > 0
+
+    def canFetchMore(self, parent_idx):
+        parent_item = self.getItem(parent_idx)
+        return isinstance(parent_item, ClusterNode) and parent_item.canFetchMore()
+
+    def fetchMore(self, parent_idx):
+        parent_item = self.getItem(parent_idx)
+        if not isinstance(parent_item, ClusterNode):
+            return
+        beg = parent_item.childCount()
+        count = min(RESULT_FETCH_BATCH, parent_item.rowTotal() - beg)
+        if count <= 0:
+            return
+        self.beginInsertRows(parent_idx, beg, beg + count - 1)
+        parent_item.fetchMore(count)
+        self.endInsertRows()
 
     def addChild(self, data, parent_idx=QModelIndex()):
         parent_item = self.getItem(parent_idx)
@@ -81,49 +405,38 @@ class ResultModel(QAbstractItemModel):
         parent_item.addChild(child_item)
 
     def index(self, row, col, _parent=QModelIndex()):
-        parent = self.getItem(_parent)
-
         if not self.hasIndex(row, col, _parent):
             return QModelIndex()
-
-        child = parent.child(row)
-        if child:
-            return self.createIndex(row, col, child)
-        return QModelIndex()
+        # an index points to the node of its parent, rows of a cluster have no nodes
+        return self.createIndex(row, col, self.getItem(_parent))
 
     def parent(self, index):
         if index.isValid():
-            child_item = self.getItem(index)
-            parent_item = child_item.parent()
+            parent_item = index.internalPointer()
             if parent_item == self.iroot:
                 return QModelIndex()
-            return self.createIndex(parent_item.row(), 0, parent_item)
+            return self.createIndex(parent_item.row(), 0, self.iroot)
         # Return an invalid QModelIndex() to indicate "no parent."
         return QModelIndex()
 
     def columnCount(self, parent_idx=QModelIndex()):
         parent_item = self.getItem(parent_idx)
-        return parent_item.columnCount()
+        return parent_item.columnCount() if parent_item else self.iroot.columnCount()
 
     def data(self, index, role=Qt.DisplayRole):
         if not index.isValid():
             return None
-        node = self.getItem(index)
+        parent_item = index.internalPointer()
+        row, col = index.row(), index.column()
 
         if role == Qt.DisplayRole:
-            col = index.column()
-            data = node.data(col)
-            return data.replace('%', '_') if self.heads[col] == 'Name' else data
-        elif role == Qt.BackgroundRole:
-            rgb_string = node.data(self.bg_col)
-            if rgb_string and rgb_string != 'rgb(255,255,255)':
-                r, g, b = map(int, rgb_string.removeprefix("rgb(").removesuffix(")").split(","))
-                color = QColor(r, g, b)
-                if self.env.lib_qt == 'pyqt5':
-                    return color
-                elif self.env.lib_qt == 'pyside':
-                    brush = QBrush(color)
-                    return brush
+            if isinstance(parent_item, ClusterNode):
+                return parent_item.rowData(row, col, self.fmts[col])
+            return parent_item.child(row).data(col, self.fmts[col])
+        elif role == Qt.BackgroundRole and isinstance(parent_item, ClusterNode) and self.bg_col is not None:
+            rgb_value = parent_item.rowValue(row, self.bg_col)
+            if rgb_value is not None and rgb_value != 0xFFFFFF:
+                return get_color_brush(rgb_value, self.env.lib_qt)
         return None
 
     def headerData(self, section, orientation, role=Qt.DisplayRole):
@@ -138,11 +451,11 @@ class ResultModel(QAbstractItemModel):
         if not index.isValid() or role != Qt.EditRole:
             return False
 
-        item = self.getItem(index)
+        parent_item = index.internalPointer()
         set_col = index.column()
         lib_qt = self.env.lib_qt
 
-        if value.startswith('rgb'):
+        if set_col == self.bg_col:
             beg_col = 0
             end_col = set_col if lib_qt == 'pyqt5' else None
             roles = [Qt.BackgroundRole]
@@ -151,7 +464,15 @@ class ResultModel(QAbstractItemModel):
             end_col = set_col + 1 if lib_qt == 'pyqt5' else None
             roles = [Qt.EditRole]
 
-        item.setData(set_col, value)
+        if isinstance(parent_item, ClusterNode):
+            parent_item.setRowData(index.row(), set_col, value)
+            col_index = self.col_indexes.get(set_col)
+            if col_index:
+                col_index.setText(parent_item.row(), index.row(),
+                                  parent_item.rowData(index.row(), set_col, self.fmts[set_col]))
+                self.index_epoch += 1
+        else:
+            parent_item.child(index.row()).setData(set_col, value)
         beg_idx = index.sibling(index.row(), beg_col)
         if lib_qt == 'pyqt5':
             end_idx = index.sibling(index.row(), end_col)
@@ -162,9 +483,107 @@ class ResultModel(QAbstractItemModel):
 
     def getItem(self, index):
         if index and index.isValid():
-            # Get the pointer to the item associated with the index.
-            item = index.internalPointer()
-            if item:
-                return item
+            # Get the node of the index from the node of its parent,
+            # none for the rows of a cluster.
+            parent_item = index.internalPointer()
+            if parent_item == self.iroot:
+                return parent_item.child(index.row())
+            return None
         # Return the root item if the index is invalid.
         return self.iroot
+
+
+def benchmark(row_count=500000):
+    """
+    Compare a cluster of column values to a cluster of the former row nodes.
+
+    Rows are made and displayed twice, the former nodes hold the stringified
+    values the result view used to get.
+    """
+    import time
+    import tracemalloc
+
+    class BaselineNode(object):
+        # the former ResultNode, a node of strings per row
+        def __init__(self, data, parent=None):
+            self._data = data
+            self._col_count = len(self._data)
+            self._children = []
+            self._parent = parent
+
+        def data(self, col):
+            if 0 <= col < len(self._data):
+                _data = self._data[col]
+                return str(_data) if _data != None else ""
+
+        def columnCount(self):
+            return self._col_count
+
+        def addChild(self, child):
+            child._parent = self
+            self._children.append(child)
+            self._col_count = max(child.columnCount(), self._col_count)
+
+    heads = ['Name', 'Address', 'Size', 'Chunks', 'Nodes', 'Edges', 'Comment', 'Color']
+    fmts = [HEAD_FORMATS.get(head, str) for head in heads]
+    def get_row(func_id, func_cmnt):
+        addr = 0x401000 + func_id * 16
+        return ["sub_{:X}".format(addr), addr, func_id % 4096, 1, func_id % 64, func_id % 96, func_cmnt, 0xFFFFFF]
+
+    def build(is_columnar):
+        func_ids = array.array('l', range(row_count))
+        func_cmnts = [""] * row_count
+        if is_columnar:
+            cluster = ClusterNode("cluster", func_ids, func_cmnts, get_row,
+                                  lambda func_id, func_cmnt, col: get_row(func_id, func_cmnt)[col], len(heads))
+            cluster.fetchMore(row_count)
+            return cluster
+        cluster = BaselineNode(["cluster ({})".format(row_count)])
+        for func_id, func_cmnt in zip(func_ids, func_cmnts):
+            row = get_row(func_id, func_cmnt)
+            row[1], row[7] = hex(row[1]), format_color(row[7])
+            cluster.addChild(BaselineNode(row))
+        return cluster
+
+    def paint(cluster, is_columnar):
+        for row in range(row_count):
+            for col, head in enumerate(heads):
+                if is_columnar:
+                    cluster.rowData(row, col, fmts[col])
+                else:
+                    disp = cluster._children[row].data(col)
+                    if head == 'Name':
+                        disp.replace('%', '_')
+
+    row_fmt = "{:>8} {:>10} {:>10} {:>10} {:>10}"
+    print(row_fmt.format('node', 'build (s)', 'paint (s)', 'repaint', 'mem (MB)'))
+    for is_columnar in (False, True):
+        time_beg = time.time()
+        cluster = build(is_columnar)
+        time_build = time.time() - time_beg
+
+        time_paint = []
+        for _ in range(2):
+            time_beg = time.time()
+            paint(cluster, is_columnar)
+            time_paint.append(time.time() - time_beg)
+        del cluster
+
+        # memory of the painted rows, measured apart as tracing slows all down
+        tracemalloc.start()
+        cluster = build(is_columnar)
+        paint(cluster, is_columnar)
+        mem_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del cluster
+
+        print(row_fmt.format(
+            "columnar" if is_columnar else "baseline",
+            "%.2f" % time_build,
+            "%.2f" % time_paint[0],
+            "%.2f" % time_paint[1],
+            "%.1f" % (mem_size / (1024.0 * 1024.0))))
+
+if __name__ == '__main__':
+    import sys
+    benchmark(*map(int, sys.argv[1:2]))
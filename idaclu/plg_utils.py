@@ -1,7 +1,12 @@
+import array
+import bisect
 import collections
+import mmap
+import multiprocessing
 import os
 import re
 import sys
+import tempfile
 
 
 class PluginPath():
@@ -152,3 +157,124 @@ def import_path(path):
 
 def get_prog_val(base, range, part, whole):
     return base + int(range * (part / whole))
+
+def get_pool_executable():
+    # inside IDA sys.executable is IDA itself, workers need a bare interpreter
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return sys.executable
+    for exe_dir in (sys.exec_prefix, os.path.join(sys.exec_prefix, 'bin')):
+        for exe_name in ('python.exe', 'python3', 'python'):
+            exe_path = os.path.join(exe_dir, exe_name)
+            if os.path.isfile(exe_path):
+                return exe_path
+    return None
+
+def get_process_pool(module_dir, initializer=None, initargs=(), proc_count=None):
+    """Start a pool of spawned workers able to import modules from 'module_dir'.
+
+    None is returned when there is a single CPU or processes cannot be
+    spawned, the caller is expected to fall back to in-process work.
+    """
+    try:
+        cpu_count = multiprocessing.cpu_count()
+    except NotImplementedError:
+        return None
+    proc_count = min(proc_count or cpu_count, cpu_count)
+    exe_path = get_pool_executable()
+    if proc_count < 2 or exe_path is None:
+        return None
+
+    try:
+        context = multiprocessing.get_context('spawn')
+    except AttributeError:  # Python 2
+        context = multiprocessing
+    if not hasattr(context, 'set_executable'):
+        return None
+    try:
+        context.set_executable(exe_path)
+        # workers import the initializer's module by name
+        with PluginPath(module_dir):
+            pool = context.Pool(proc_count, initializer, initargs)
+    except (OSError, ValueError, ImportError):
+        return None
+    return pool
+
+def get_offset_array(values=()):
+    # 64-bit file offsets, the 'q' type code is missing in Python 2
+    try:
+        return array.array('q', values)
+    except ValueError:
+        return array.array('l', values)
+
+def write_snapshot(seg_views, func_chunks):
+    """Write function bytes to a temporary file worker processes can map.
+
+    'seg_views' is a list of (segment start, segment bytes) written back
+    to back, 'func_chunks' is a list of (func_addr, [(chunk_beg, chunk_end)])
+    of chunks lying within those segments. The returned descriptor is
+    small enough to be passed to each worker.
+    """
+    seg_offs = {}
+    fd, snap_path = tempfile.mkstemp(prefix='idaclu_', suffix='.snap')
+    with os.fdopen(fd, 'wb') as snap_file:
+        file_off = 0
+        for seg_beg, seg_view in seg_views:
+            snap_file.write(seg_view)
+            seg_offs[seg_beg] = (file_off, len(seg_view))
+            file_off += len(seg_view)
+
+    seg_begs = sorted(seg_offs)
+    chunk_offs = get_offset_array()
+    chunk_lens = get_offset_array()
+    func_first = get_offset_array([0])
+    for func_addr, chunks in func_chunks:
+        for chunk_beg, chunk_end in chunks:
+            seg_beg = seg_begs[bisect.bisect_right(seg_begs, chunk_beg) - 1]
+            chunk_offs.append(seg_offs[seg_beg][0] + chunk_beg - seg_beg)
+            chunk_lens.append(chunk_end - chunk_beg)
+        func_first.append(len(chunk_offs))
+
+    return {
+        'path': snap_path,
+        'funcs': [func_addr for func_addr, _ in func_chunks],
+        'offs': chunk_offs,
+        'lens': chunk_lens,
+        'first': func_first
+    }
+
+def remove_snapshot(snapshot):
+    try:
+        os.remove(snapshot['path'])
+    except OSError:
+        pass
+
+class SnapshotReader(object):
+    """Read-only view of a snapshot written by write_snapshot()."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.file = open(snapshot['path'], 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.data = memoryview(b'')
+        if self.size:
+            self.data = memoryview(mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def get_func_bytes(self, func_idx):
+        # slices of the mapping are not copied, only chunked functions are joined
+        snap = self.snapshot
+        chunk_views = []
+        for chunk_idx in range(snap['first'][func_idx], snap['first'][func_idx + 1]):
+            chunk_off = snap['offs'][chunk_idx]
+            chunk_views.append(self.data[chunk_off:chunk_off + snap['lens'][chunk_idx]])
+        if len(chunk_views) == 1:
+            return chunk_views[0]
+        return memoryview(b''.join(chunk_views))
+
+    def close(self):
+        self.data = None
+        self.file.close()
+
+def get_index_chunks(count, chunk_count):
+    # contiguous index ranges of roughly equal size
+    chunk_size = max(1, count // max(1, chunk_count))
+    return [(beg, min(beg + chunk_size, count)) for beg in range(0, count, chunk_size)]
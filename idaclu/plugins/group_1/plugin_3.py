@@ -13,6 +13,7 @@ SCRIPT_NAME = i18n('Xref Destination')
 SCRIPT_TYPE = 'func'
 SCRIPT_VIEW = 'tree'
 SCRIPT_ARGS = []
+SCRIPT_PASSES = 5  # cleanup, discovery (x2), clustering, cleanup
 
 def is_fname_main(func_name):
     is_main = func_name.startswith('_') and 'main' in func_name.lower()
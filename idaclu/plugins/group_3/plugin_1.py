@@ -4,6 +4,7 @@ import json
 import idaapi
 import idautils
 #
+from idaclu import feature_store
 from idaclu import ida_shims
 from idaclu.qt_utils import i18n
 
@@ -42,7 +43,7 @@ def is_func_loop(func_desc):
     func_start_ea = ida_shims.start_ea(func_desc)
 
     blocks = [func_start_ea]
-    for block in idaapi.FlowChart(func_desc):
+    for block in feature_store.get_flowchart(func_start_ea):
         end_ea = ida_shims.end_ea(block)
         blocks.append(end_ea)
 
@@ -58,7 +59,7 @@ def is_func_loop(func_desc):
 
 
 def is_func_simple_recursion(func_addr):
-    for h in idautils.FuncItems(func_addr):
+    for h in feature_store.get_func_items(func_addr):
         for r in idautils.XrefsFrom(h, 0):
             if ((r.type == idaapi.fl_CF or r.type == idaapi.fl_CN) and
                 r.to == func_addr):
@@ -84,7 +85,7 @@ def is_func_recursion(func_addr):
     stack = stack[:-1]
 
 def is_func_condition(func_desc):
-    bb_list = list(idaapi.FlowChart(func_desc))
+    bb_list = list(feature_store.get_flowchart(ida_shims.start_ea(func_desc)))
     bb_num = len(bb_list)
     bb_conn_count = len(list(bb_list[0].succs()))
     if ((bb_num == 1 and bb_conn_count == 0) or
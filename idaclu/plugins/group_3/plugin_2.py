@@ -2,9 +2,9 @@ import collections
 import json
 import re
 #
-import idaapi
 import idautils
 #
+from idaclu import feature_store
 from idaclu import ida_shims
 from idaclu.qt_utils import i18n
 
@@ -24,41 +24,25 @@ def sort_nat(input_dict):
 
     return collections.OrderedDict(sorted(input_dict.items(), key=cmp_key))
 
-def get_psdo_list(func_ea):
-    func_pseudocode = []
-    decomp_str = ""
-    try:
-       decomp_str = idaapi.decompile(func_ea)
-    except idaapi.DecompilationFailure:
-       return []
-    for line in str(decomp_str).split('\n'):
-        if '//' in line:
-            code = line.split('//')[0]
-            if code != '':
-                func_pseudocode.append(code.lstrip())
-        else:
-            if line != '':
-                func_pseudocode.append(line.lstrip())
-    return func_pseudocode
-    
-def get_psdo_body(func_ea):
-    psdo_list = get_psdo_list(func_ea)
-    return psdo_list[2:-1]
-
 def get_data(func_gen=None, env_desc=None, plug_params=None):
     report = {
         'data': collections.defaultdict(list),
         'stat': collections.defaultdict(int)
     }
 
+    skipped = []
     for func_addr in func_gen():
-        func_psdo_size = len(get_psdo_body(func_addr))
+        func_psdo_size = len(feature_store.get_psdo_body(func_addr))
+        if feature_store.is_psdo_skipped(func_addr, skipped):
+            continue
         key_name = "size: {}".format(func_psdo_size)
         report['data'][key_name].append(func_addr)
         report['stat'][key_name] += 1
 
     report['data'] = sort_nat(report['data'])
     report['stat'] = sort_nat(report['stat'])
+
+    feature_store.add_psdo_skipped(report, skipped)
     return report if __name__ == '__main__' else report['data']
 
 def debug():
@@ -1,12 +1,17 @@
 #!/usr/bin/python
 import os
-import re
 import sys
 import mmap
 import struct
 import collections
 from ctypes import *
 
+# optional, large basic block tables are memory-mapped instead of read
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 #------------------------------------------------------------------------------
 # DynamoRIO Drcov Log Parser
@@ -17,8 +22,9 @@ class DrcovData(object):
     A drcov log parser.
     """
 
-    def __init__(self, filepath=None):
+    def __init__(self, filepath=None, use_numpy=True):
         self.filepath = filepath
+        self.use_numpy = use_numpy and np is not None
 
         # drcov header attributes
         self.version = 0
@@ -34,6 +40,9 @@ class DrcovData(object):
         self.bb_table_count = 0
         self.bb_table_is_binary = True
 
+        # basic block rows grouped by module id, built on first lookup
+        self.bb_module_index = None
+
         # parse
         self._parse()
 
@@ -63,8 +72,10 @@ class DrcovData(object):
         # extract the unique module ids that we need to collect blocks for
         mod_ids = [module.id for module in modules]
 
-        # loop through the coverage data and filter out data for the target ids
-        coverage_blocks = [bb.start for bb in self.bbs if bb.mod_id in mod_ids]
+        # collect the rows of the target ids from the module index
+        if self.use_numpy:
+            return self.bbs['start'][self._get_module_rows(mod_ids)]
+        coverage_blocks = [self.bbs[i].start for i in self._get_module_rows(mod_ids)]
 
         # return the filtered coverage blocks
         return coverage_blocks
@@ -84,12 +95,51 @@ class DrcovData(object):
         # extract the unique module ids that we need to collect blocks for
         mod_ids = [module.id for module in modules]
 
-        # loop through the coverage data and filter out data for the target ids
-        coverage_blocks = [(bb.start, bb.size) for bb in self.bbs if bb.mod_id in mod_ids]
+        # NOTE: the records of the structured array unpack as (start, size, mod_id)
+        if self.use_numpy:
+            return self.bbs[self._get_module_rows(mod_ids)]
+        bbs = self.bbs
+        coverage_blocks = [(bbs[i].start, bbs[i].size) for i in self._get_module_rows(mod_ids)]
 
         # return the filtered coverage blocks
         return coverage_blocks
 
+    def _get_module_rows(self, mod_ids):
+        """
+        Return the basic block table rows of the given module ids.
+
+        The first lookup groups all rows by module id in a single pass,
+        so that each further lookup only touches the rows it returns.
+        """
+        if self.bb_module_index is None:
+            self.bb_module_index = self._build_module_index()
+
+        if self.use_numpy:
+            order, bounds = self.bb_module_index
+            rows = [order[bounds[mod_id]:bounds[mod_id + 1]] for mod_id in mod_ids]
+            return np.sort(np.concatenate(rows)) if rows else order[:0]
+
+        rows = []
+        for mod_id in mod_ids:
+            rows.extend(self.bb_module_index.get(mod_id, []))
+        return sorted(rows)
+
+    def _build_module_index(self):
+        """
+        Group the basic block table rows by module id.
+        """
+
+        # a stable sort of 16 bit keys is a linear radix sort in numpy
+        if self.use_numpy:
+            order = np.argsort(self.bbs['mod_id'], kind='stable')
+            bounds = np.searchsorted(self.bbs['mod_id'][order], np.arange(0x10001))
+            return order, bounds
+
+        module_index = collections.defaultdict(list)
+        for i, bb in enumerate(self.bbs):
+            module_index[bb.mod_id].append(i)
+        return module_index
+
     #--------------------------------------------------------------------------
     # Parsing Routines - Top Level
     #--------------------------------------------------------------------------
@@ -232,6 +282,9 @@ class DrcovData(object):
     def _parse_module_table_modules(self, f):
         """
         Parse drcov log modules in the module table from filestream.
+
+        The table has a line per loaded module, a few hundred at most, so
+        it is parsed line by line, unlike the basic block table.
         """
         modules = collections.defaultdict(list)
 
@@ -286,39 +339,104 @@ class DrcovData(object):
         Parse drcov log basic block table entries from filestream.
         """
 
-        # allocate the ctypes structure array of basic blocks
-        self.bbs = (DrcovBasicBlock * self.bb_table_count)()
+        # map the binary table in place, the OS pages in only what is touched
+        if self.use_numpy and self.bb_table_is_binary:
+            self._map_bb_table_entries(f)
+            return
+
+        # allocate the basic block table, a structured array or ctypes structures
+        if self.use_numpy:
+            self.bbs = np.zeros(self.bb_table_count, dtype=DRCOV_BB_DTYPE)
+        else:
+            self.bbs = (DrcovBasicBlock * self.bb_table_count)()
 
         # read binary basic block entries directly into the newly allocated array
         if self.bb_table_is_binary:
             f.readinto(self.bbs)
 
-        # parse the plaintext basic block entries one by one
+        # parse the plaintext basic block entries chunk by chunk
         else:
             self._parse_bb_table_text_entries(f)
 
-    def _parse_bb_table_text_entries(self, f):
+    def _map_bb_table_entries(self, f):
+        """
+        Memory-map drcov log binary basic block entries from filestream.
+        """
+
+        # np.memmap refuses to map zero bytes
+        if self.bb_table_count == 0:
+            self.bbs = np.zeros(0, dtype=DRCOV_BB_DTYPE)
+            return
+
+        self.bbs = np.memmap(
+            self.filepath,
+            dtype=DRCOV_BB_DTYPE,
+            mode='r',
+            offset=f.tell(),
+            shape=(self.bb_table_count,)
+        )
+
+    def _parse_bb_table_text_entries(self, f, chunk_size=0x1000000):
         """
         Parse drcov log basic block table text entries from filestream.
+
+        The table is read in large chunks and each chunk is split into
+        fields at once, instead of matching one line at a time.
         """
         table_header = f.readline().decode('utf-8').strip()
 
         if table_header != "module id, start, size:":
             raise ValueError("Invalid BB header: %r" % table_header)
 
-        pattern = re.compile(r"^module\[\s*(?P<mod>[0-9]+)\]\:\s*(?P<start>0x[0-9a-fA-F]+)\,\s*(?P<size>[0-9]+)$")
-        for i, bb in enumerate(self.bbs):
-            text_entry = f.readline().decode('utf-8').strip()
-            if not text_entry:
-                continue
-
-            match = pattern.match(text_entry)
-            if not match:
-                raise ValueError("Invalid BB entry: %r" % text_entry)
+        index = 0
+        tail = b""
+        while index < self.bb_table_count:
+            chunk = f.read(chunk_size)
+            if chunk:
+                # keep the last partial line for the next chunk
+                chunk = tail + chunk
+                line_end = chunk.rfind(b"\n") + 1
+                chunk, tail = chunk[:line_end], chunk[line_end:]
+            else:
+                # the last line may have no trailing newline
+                chunk, tail = tail, b""
+                if not chunk:
+                    break
+            index = self._parse_bb_table_text_chunk(chunk, index)
+
+    def _parse_bb_table_text_chunk(self, chunk, index):
+        """
+        Parse a chunk of whole drcov log basic block table text lines.
+
+        eg: 'module[  4]: 0x0000000000001000,  12'
+        """
+        fields = chunk.replace(b"module[", b" ").translate(None, b"]:,").split()
+        if len(fields) % 3 != 0:
+            raise ValueError("Invalid BB entry near block %u" % index)
+
+        # the rows past the header count are ignored
+        count = min(len(fields) // 3, self.bb_table_count - index)
+        try:
+            mod_ids = list(map(int, fields[0:count * 3:3]))
+            starts = [int(field, 16) for field in fields[1:count * 3:3]]
+            sizes = list(map(int, fields[2:count * 3:3]))
+        except ValueError:
+            raise ValueError("Invalid BB entry near block %u" % index)
+
+        # store the fields straight into the compact basic block table
+        if isinstance(self.bbs, Array):
+            values = [0] * (count * 3)
+            values[0::3] = starts
+            values[1::3] = sizes
+            values[2::3] = mod_ids
+            packed = struct.pack("=" + "IHH" * count, *values)
+            memmove(addressof(self.bbs) + index * sizeof(DrcovBasicBlock), packed, len(packed))
+        else:
+            self.bbs['start'][index:index + count] = starts
+            self.bbs['size'][index:index + count] = sizes
+            self.bbs['mod_id'][index:index + count] = mod_ids
 
-            bb.start = int(match.group("start"), 16)
-            bb.size = int(match.group("size"), 10)
-            bb.mod_id = int(match.group("mod"), 10)
+        return index + count
 
 #------------------------------------------------------------------------------
 # drcov module parser
@@ -476,3 +594,86 @@ class DrcovBasicBlock(Structure):
         ('size',   c_uint16),
         ('mod_id', c_uint16)
     ]
+
+# the same layout as DrcovBasicBlock, for the memory-mapped tables
+if np is not None:
+    DRCOV_BB_DTYPE = np.dtype([
+        ('start',  np.uint32),
+        ('size',   np.uint16),
+        ('mod_id', np.uint16)
+    ])
+else:
+    DRCOV_BB_DTYPE = None
+
+
+#------------------------------------------------------------------------------
+# Benchmark
+#------------------------------------------------------------------------------
+
+def write_synthetic_log(filepath, bb_count, is_binary, seed=0):
+    """
+    Write a drcov log with two modules and random basic blocks.
+    """
+    rng = np.random.RandomState(seed)
+    header = (
+        "DRCOV VERSION: 2\n"
+        "DRCOV FLAVOR: drcov\n"
+        "Module Table: version 2, count 2\n"
+        "Columns: id, base, end, entry, path\n"
+        "  0, 0x0000000000400000, 0x0000000000500000, 0x0000000000000000, /bin/target\n"
+        "  1, 0x00007f0000000000, 0x00007f0000100000, 0x0000000000000000, /lib/libc.so\n"
+        "BB Table: %u bbs\n" % bb_count
+    )
+    with open(filepath, "wb") as f:
+        f.write(header.encode('utf-8'))
+        if not is_binary:
+            f.write(b"module id, start, size:\n")
+        step = 0x100000
+        for beg in range(0, bb_count, step):
+            bbs = np.zeros(min(step, bb_count - beg), dtype=DRCOV_BB_DTYPE)
+            bbs['start'] = rng.randint(0, 0x100000, len(bbs))
+            bbs['size'] = rng.randint(1, 64, len(bbs))
+            bbs['mod_id'] = rng.randint(0, 2, len(bbs))
+            if is_binary:
+                f.write(bbs.tobytes())
+            else:
+                f.write("".join(
+                    "module[%3u]: 0x%016x, %u\n" % (mod_id, start, size)
+                    for start, size, mod_id in bbs.tolist()).encode('utf-8'))
+
+def benchmark(bb_count=26000000):
+    """
+    Compare loading the same basic blocks from binary and text logs.
+
+    The default block count makes the text log about 1 GB.
+    """
+    import tempfile
+    import time
+
+    row_fmt = "{:>8} {:>10} {:>10} {:>10}"
+    print(row_fmt.format('format', 'size (MB)', 'load (s)', 'filter (s)'))
+    temp_dir = tempfile.mkdtemp()
+    for is_binary in (True, False):
+        filepath = os.path.join(temp_dir, "bench.%s.log" % ("bin" if is_binary else "txt"))
+        write_synthetic_log(filepath, bb_count, is_binary)
+
+        time_beg = time.time()
+        data = DrcovData(filepath)
+        time_load = time.time() - time_beg
+
+        time_beg = time.time()
+        blocks = data.get_offset_blocks("target")
+        blocks['start'].sum()  # touch the mapped pages
+        time_filter = time.time() - time_beg
+
+        print(row_fmt.format(
+            "binary" if is_binary else "text",
+            os.path.getsize(filepath) // (1024 * 1024),
+            "%.2f" % time_load,
+            "%.2f" % time_filter))
+        del data, blocks
+        os.remove(filepath)
+    os.rmdir(temp_dir)
+
+if __name__ == '__main__':
+    benchmark(*map(int, sys.argv[1:2]))
@@ -1,4 +1,3 @@
-import bisect
 import collections
 import json
 import os
@@ -6,24 +5,53 @@ import os
 import idautils
 import idaapi
 #
+from idaclu import feature_store
 from idaclu import ida_shims
 from idaclu.qt_utils import i18n
 #
-import drcov
+import traces
 
 
 SCRIPT_NAME = i18n('Covered Functions')
 SCRIPT_TYPE = 'func'
 SCRIPT_VIEW = 'tree'
-SCRIPT_ARGS = [('textedit', 'file_path', ['input the file path'])]
+SCRIPT_ARGS = [('textedit', 'file_path', ['input the file, directory or glob path'])]
 
 
-def find_function(block_start, function_ranges):
-    index = bisect.bisect_right(function_ranges, (block_start, block_start))
-
-    if index > 0 and block_start <= function_ranges[index - 1][1]:
-        return function_ranges[index - 1]
-    return None
+def get_function_ranges(func_gen):
+    function_ranges = []
+    for func_addr in func_gen():
+        for chunk_beg, chunk_end in idautils.Chunks(func_addr):
+            function_ranges.append((chunk_beg, chunk_end, func_addr))
+    function_ranges.sort()
+    return function_ranges
+
+def get_block_ranges(func_addrs):
+    # blocks outside of the function chunks, e.g. external ones, are left out
+    block_ranges = []
+    for func_addr in func_addrs:
+        func_chunks = list(idautils.Chunks(func_addr))
+        for block in feature_store.get_flowchart(func_addr, idaapi.FC_NOEXT):
+            block_beg, block_end = ida_shims.start_ea(block), ida_shims.end_ea(block)
+            if any(chunk_beg <= block_beg < chunk_end for chunk_beg, chunk_end in func_chunks):
+                block_ranges.append((block_beg, block_end, func_addr))
+    return block_ranges
+
+def get_block_index(function_ranges):
+    # built once per IDB, function set and block boundaries, shared by the
+    # consecutive runs; the flow graphs the boundaries are taken from are
+    # cached along with the functions
+    func_addrs = sorted(set(func_range[2] for func_range in function_ranges))
+    block_ranges = get_block_ranges(func_addrs)
+    return feature_store.get_store().get_table(
+        'drcov_blocks', (function_ranges, block_ranges),
+        lambda: traces.get_block_index(block_ranges))
+
+def get_trace_cache():
+    idb_path = ida_shims.get_idb_path()
+    idb_name = os.path.splitext(os.path.basename(idb_path))[0]
+    cache_path = os.path.join(os.path.dirname(idb_path), "{}_idaclu_drcov.json".format(idb_name))
+    return traces.TraceCache(cache_path)
 
 
 def get_data(func_gen=None, env_desc=None, plug_params=None):
@@ -34,57 +62,67 @@ def get_data(func_gen=None, env_desc=None, plug_params=None):
             {'unique_id': 1, 'parent_id': 0, 'Function': '', 'VA': ' ', 'Size': ' '}
         ]
     }
-    raw_data = {}
-    unseen_functions = []
-    seen_functions = []
+    raw_data = collections.OrderedDict()
 
-    function_ranges = []
-    for func_addr in func_gen():
-        func_name = ida_shims.get_func_name(func_addr)
-        func_desc = idaapi.get_func(func_addr)
-        func_size = ida_shims.calc_func_size(func_desc)
-        function_ranges.append((func_addr, func_addr + func_size))
-        unseen_functions.append(func_addr)
+    function_ranges = get_function_ranges(func_gen)
+    unseen_functions = set(func_range[2] for func_range in function_ranges)
+
+    block_index = get_block_index(function_ranges)
 
-    x = None
     file_path = plug_params['file_path'][0]
-    try:
-        x = drcov.DrcovData(file_path)
-    except IOError:
-        ida_shims.msg("ERROR: Cannot open coverage file: {}".format(file_path))
+    trace_paths = traces.get_trace_paths(file_path)
+    trace_cache = get_trace_cache()
+    trace_results = traces.get_trace_results(
+        trace_paths, env_desc.ida_module, idaapi.get_imagebase(), function_ranges, block_index, trace_cache)
+    trace_cache.save()
+
+    for trace_path in trace_paths:
+        if not trace_path in trace_results:
+            ida_shims.msg("ERROR: Cannot read coverage file: {}\n".format(trace_path))
+    if not len(trace_results):
         return REPORT['data']
 
-    coverage_blocks = x.get_offset_blocks(env_desc.ida_module)
-    imagebase = idaapi.get_imagebase()
-
-    for bb in coverage_blocks:
-        block_start = imagebase + bb[0]
-        func_start = find_function(block_start, function_ranges)
-        if func_start:
-            if not func_start[0] in seen_functions:
-                seen_functions.append(func_start[0])
-
-    group_name = 'covered'
-    if not group_name in raw_data:
-        raw_data[group_name] = []
-        REPORT['stat'][group_name] = 0
-
-    for sf in seen_functions:
-        raw_data[group_name].append(sf)
-        REPORT['stat'][group_name] += 1
-
-    unseen = list(set(unseen_functions) - set(seen_functions))
-    group_name = 'uncovered'
-    if not group_name in raw_data:
-        raw_data[group_name] = []
-        REPORT['stat'][group_name] = 0
-
-    for uf in unseen:
-        raw_data[group_name].append(uf)
-        REPORT['stat'][group_name] += 1
-
-
-    REPORT['data'] = collections.OrderedDict(sorted(raw_data.items()))
+    # per function: blocks hit over all traces and number of traces hitting it
+    block_count = collections.defaultdict(int)
+    trace_count = collections.defaultdict(int)
+    block_cover = set()
+    for trace_result in trace_results.values():
+        for func_addr, count in trace_result['hits'].items():
+            block_count[func_addr] += count
+            trace_count[func_addr] += 1
+        block_cover.update(trace_result['cover'])
+    block_ratios = traces.get_block_ratios(sorted(block_cover), block_index)
+
+    # a single trace is grouped by the share of executed blocks,
+    # several ones by the share of traces hitting the function
+    total_count = len(trace_results)
+    band_names = [band[0] for band in traces.COVERAGE_BANDS] + [traces.COVERAGE_NONE]
+    if total_count > 1:
+        band_names = ['hit by 1 trace'] + [band[0] for band in traces.TRACE_BANDS]
+    band_data = collections.defaultdict(list)
+    for func_addr in sorted(block_count):
+        cover_count, total_blocks = block_ratios.get(func_addr, (0, 0))
+        func_cmnt = "{}/{} blocks, {} hits".format(cover_count, total_blocks, block_count[func_addr])
+        if total_count == 1:
+            # no executed blocks if hit outside of the flowchart, e.g. in data
+            group_name = traces.get_coverage_band(cover_count, total_blocks)
+        else:
+            group_name = traces.get_trace_band(trace_count[func_addr], total_count)
+            func_cmnt = "{} traces, {}".format(trace_count[func_addr], func_cmnt)
+        band_data[group_name].append((func_addr, func_cmnt))
+
+    for group_name in band_names:
+        if group_name in band_data:
+            raw_data[group_name] = band_data[group_name]
+
+    unseen = sorted(unseen_functions - set(block_count))
+    if len(unseen):
+        raw_data['uncovered'] = unseen
+
+    for group_name in raw_data:
+        REPORT['stat'][group_name] = len(raw_data[group_name])
+
+    REPORT['data'] = raw_data
     return REPORT['data']
 
 
@@ -93,7 +131,7 @@ def debug():
     env_desc.ida_module = os.path.basename(ida_shims.get_input_file_path())
 
     log_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'drcov.proc.log')
-    plug_params = { 'file_path': log_path }
+    plug_params = { 'file_path': [log_path] }
 
     data_obj = get_data(func_gen=idautils.Functions, env_desc=env_desc, plug_params=plug_params)
     ida_shims.msg(json.dumps(data_obj, indent=4))
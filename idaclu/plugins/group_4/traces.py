@@ -0,0 +1,298 @@
+import bisect
+import collections
+import glob
+import hashlib
+import json
+import os
+#
+try:
+    import numpy as np
+except ImportError:
+    np = None
+#
+from idaclu import plg_utils
+#
+import drcov
+
+
+TRACE_POOL_MIN = 4  # below this the pool start-up costs more than it saves
+TRACE_BANDS = [  # (name, share of traces hitting a function), first match wins
+    ('hit by all traces', 1.0),
+    ('hit by >90% of traces', 0.9),
+    ('hit by 10-90% of traces', 0.1),
+    ('hit by <10% of traces', 0.0)
+]
+COVERAGE_BANDS = [  # (name, share of executed function blocks), first match wins
+    ('covered 100%', 1.0),
+    ('covered 75-99%', 0.75),
+    ('covered 50-74%', 0.5),
+    ('covered 25-49%', 0.25),
+    ('covered 1-24%', 0.0)
+]
+COVERAGE_NONE = 'covered 0%'  # hit, but none of the function blocks executed
+
+
+def find_function(block_start, function_ranges):
+    index = bisect.bisect_right(function_ranges, (block_start, float('inf')))
+
+    if index > 0 and block_start < function_ranges[index - 1][1]:
+        return function_ranges[index - 1]
+    return None
+
+def get_block_hits(block_starts, function_ranges):
+    """Count the blocks landing in each function.
+
+    'function_ranges' is a sorted list of (chunk_beg, chunk_end, func_addr)
+    with one entry per function chunk, so that tails of non-contiguous
+    functions are attributed to their owner as well.
+    """
+    if np is None:
+        block_hits = {}
+        for block_start in block_starts:
+            func_range = find_function(block_start, function_ranges)
+            if func_range:
+                block_hits[func_range[2]] = block_hits.get(func_range[2], 0) + 1
+        return block_hits
+
+    range_beg = np.array([r[0] for r in function_ranges], dtype=np.uint64)
+    range_end = np.array([r[1] for r in function_ranges], dtype=np.uint64)
+    range_own = np.array([r[2] for r in function_ranges], dtype=np.uint64)
+    block_starts = np.asarray(block_starts, dtype=np.uint64)
+
+    # index of the last range starting at or before each block
+    index = np.searchsorted(range_beg, block_starts, side='right') - 1
+    is_inside = index >= 0
+    index = index[is_inside]
+    is_inside = block_starts[is_inside] < range_end[index]
+    func_addrs, counts = np.unique(range_own[index[is_inside]], return_counts=True)
+    return dict((int(func_addr), int(count)) for func_addr, count in zip(func_addrs, counts))
+
+
+def get_block_index(block_ranges):
+    """Build the interval index of IDA basic blocks.
+
+    'block_ranges' is a list of (block_beg, block_end, func_addr) of all
+    the blocks of the analyzed functions. Blocks are sorted by start and
+    do not overlap, so that both columns are sorted, a block of a tail
+    shared by several functions is kept for the first of them only.
+    """
+    block_ranges = sorted(r for r in block_ranges if r[1] > r[0])
+    block_ranges = [r for i, r in enumerate(block_ranges) if i == 0 or r[0] >= block_ranges[i - 1][1]]
+    block_owners = sorted(set(r[2] for r in block_ranges))
+    owner_index = dict((func_addr, idx) for idx, func_addr in enumerate(block_owners))
+    block_index = {
+        'beg': [r[0] for r in block_ranges],
+        'end': [r[1] for r in block_ranges],
+        'own': [owner_index[r[2]] for r in block_ranges],
+        'funcs': block_owners
+    }
+    # cached trace results refer to the blocks by index
+    block_blob = json.dumps([block_index['beg'], block_index['end']])
+    block_index['key'] = hashlib.md5(block_blob.encode('utf-8')).hexdigest()
+    if np is not None:
+        block_index['beg'] = np.array(block_index['beg'], dtype=np.uint64)
+        block_index['end'] = np.array(block_index['end'], dtype=np.uint64)
+        block_index['own'] = np.array(block_index['own'], dtype=np.int64)
+    return block_index
+
+def get_block_cover(block_starts, block_ends, block_index):
+    """Get sorted indexes of the IDA blocks overlapped by the trace blocks.
+
+    A trace block may span several IDA blocks, e.g. when a call does not
+    end the block for DynamoRIO, all of them are counted as executed.
+    """
+    index_beg, index_end = block_index['beg'], block_index['end']
+    if np is None:
+        block_cover = set()
+        for block_beg, block_end in zip(block_starts, block_ends):
+            idx = bisect.bisect_right(index_end, block_beg)
+            while idx < len(index_beg) and index_beg[idx] < block_end:
+                block_cover.add(idx)
+                idx += 1
+        return sorted(block_cover)
+
+    # [lo, hi) is the run of IDA blocks each trace block overlaps
+    lo = np.searchsorted(index_end, block_starts, side='right')
+    hi = np.searchsorted(index_beg, block_ends, side='left')
+    is_span = lo < hi
+    edge_count = len(index_beg) + 1
+    edges = (np.bincount(lo[is_span], minlength=edge_count) -
+             np.bincount(hi[is_span], minlength=edge_count))
+    return np.flatnonzero(np.cumsum(edges[:-1]) > 0)
+
+def get_block_ratios(block_cover, block_index):
+    """Get {func_addr: (executed_blocks, total_blocks)} of the touched functions."""
+    func_addrs = block_index['funcs']
+    if np is None:
+        total_count = collections.Counter(block_index['own'])
+        cover_count = collections.Counter(block_index['own'][idx] for idx in block_cover)
+        return dict((func_addrs[own], (count, total_count[own])) for own, count in cover_count.items())
+
+    own = block_index['own']
+    total_count = np.bincount(own, minlength=len(func_addrs))
+    cover_count = np.bincount(own[np.asarray(block_cover, dtype=np.int64)], minlength=len(func_addrs))
+    return dict((func_addrs[idx], (int(cover_count[idx]), int(total_count[idx])))
+                for idx in np.flatnonzero(cover_count))
+
+
+_worker_data = {}
+
+def init_trace_worker(module_name, imagebase, function_ranges, block_index):
+    _worker_data['module_name'] = module_name
+    _worker_data['imagebase'] = imagebase
+    _worker_data['function_ranges'] = function_ranges
+    _worker_data['block_index'] = block_index
+
+def parse_trace(trace_path):
+    """Reduce a drcov log to the function hits and the executed IDA blocks.
+
+    Returns (trace_path, {'hits': {func_addr: block_count}, 'cover': [block_idx]}),
+    the result is None if the log cannot be read.
+    """
+    try:
+        trace = drcov.DrcovData(trace_path, use_numpy=np is not None)
+    except (IOError, ValueError, AssertionError, IndexError):
+        return trace_path, None
+    imagebase = _worker_data['imagebase']
+    blocks = trace.get_offset_blocks(_worker_data['module_name'])
+    if np is None:
+        block_starts = [imagebase + block[0] for block in blocks]
+        block_ends = [imagebase + block[0] + block[1] for block in blocks]
+    else:
+        block_starts = blocks['start'].astype(np.uint64) + np.uint64(imagebase)
+        block_ends = block_starts + blocks['size'].astype(np.uint64)
+    block_cover = get_block_cover(block_starts, block_ends, _worker_data['block_index'])
+    return trace_path, {
+        'hits': get_block_hits(block_starts, _worker_data['function_ranges']),
+        'cover': [int(idx) for idx in block_cover]
+    }
+
+
+class TraceCache(object):
+    """Per-IDB JSON file of function hits and executed blocks of the already parsed traces.
+
+    Entries are validated by the log modification time and size, and by
+    a key of the module, image base, function ranges and basic blocks
+    they were mapped against.
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.entries = {}
+        self.is_dirty = False
+        if os.path.isfile(cache_path):
+            try:
+                with open(cache_path, "r") as json_file:
+                    self.entries = json.load(json_file)
+            except ValueError:
+                self.entries = {}
+
+    def get(self, trace_path, trace_key):
+        # a log that is gone or unreadable is a miss, the parser reports it
+        entry = self.entries.get(trace_path)
+        trace_stat = self.get_stat(trace_path)
+        if entry is None or trace_stat is None or entry['stat'] != trace_stat or entry['key'] != trace_key:
+            return None
+        return {
+            'hits': dict((int(func_addr, 16), count) for func_addr, count in entry['hits'].items()),
+            'cover': entry['cover']
+        }
+
+    def put(self, trace_path, trace_key, trace_result):
+        trace_stat = self.get_stat(trace_path)
+        if trace_stat is None:
+            return
+        self.entries[trace_path] = {
+            'stat': trace_stat,
+            'key': trace_key,
+            'hits': dict((hex(func_addr), count) for func_addr, count in trace_result['hits'].items()),
+            'cover': trace_result['cover']
+        }
+        self.is_dirty = True
+
+    def save(self):
+        if not self.is_dirty:
+            return
+        # traces that were removed from disk are dropped
+        for trace_path in [p for p in self.entries if not os.path.isfile(p)]:
+            del self.entries[trace_path]
+        with open(self.cache_path, "w") as json_file:
+            json.dump(self.entries, json_file)
+        self.is_dirty = False
+
+    @staticmethod
+    def get_stat(trace_path):
+        try:
+            trace_stat = os.stat(trace_path)
+        except OSError:
+            return None
+        return [int(trace_stat.st_mtime), trace_stat.st_size]
+
+
+def get_trace_paths(path_spec):
+    """Expand a log path, a directory of logs or a glob pattern."""
+    path_spec = path_spec.strip()
+    if os.path.isdir(path_spec):
+        path_spec = os.path.join(path_spec, '*')
+    trace_paths = glob.glob(path_spec) if glob.has_magic(path_spec) else [path_spec]
+    return sorted(os.path.abspath(p) for p in trace_paths if not os.path.isdir(p))
+
+def get_trace_key(module_name, imagebase, function_ranges, block_index):
+    range_blob = json.dumps([module_name, imagebase, function_ranges, block_index['key']])
+    return hashlib.md5(range_blob.encode('utf-8')).hexdigest()
+
+def get_trace_results(trace_paths, module_name, imagebase, function_ranges, block_index, trace_cache=None):
+    """Get {trace_path: parse_trace result} for each readable trace.
+
+    Traces found in the cache are not parsed again, the rest is parsed
+    in a process pool when there are enough of them.
+    """
+    trace_key = get_trace_key(module_name, imagebase, function_ranges, block_index)
+    trace_results = {}
+    trace_todo = []
+    for trace_path in trace_paths:
+        trace_result = trace_cache.get(trace_path, trace_key) if trace_cache else None
+        if trace_result is None:
+            trace_todo.append(trace_path)
+        else:
+            trace_results[trace_path] = trace_result
+
+    initargs = (module_name, imagebase, function_ranges, block_index)
+    pool = None
+    if len(trace_todo) >= TRACE_POOL_MIN:
+        pool = plg_utils.get_process_pool(
+            os.path.dirname(os.path.abspath(__file__)),
+            init_trace_worker, initargs, len(trace_todo))
+    if pool:
+        try:
+            results = list(pool.imap_unordered(parse_trace, trace_todo))
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        init_trace_worker(*initargs)
+        results = [parse_trace(trace_path) for trace_path in trace_todo]
+
+    for trace_path, trace_result in results:
+        if trace_result is None:
+            continue
+        trace_results[trace_path] = trace_result
+        if trace_cache:
+            trace_cache.put(trace_path, trace_key, trace_result)
+    return trace_results
+
+def get_band(share, bands):
+    for band_name, band_share in bands:
+        if share >= band_share:
+            return band_name
+
+def get_trace_band(trace_count, total_count):
+    if trace_count == 1:
+        return 'hit by 1 trace'
+    return get_band(trace_count / float(total_count), TRACE_BANDS)
+
+def get_coverage_band(cover_count, block_count):
+    if cover_count == 0:
+        return COVERAGE_NONE
+    return get_band(cover_count / float(block_count), COVERAGE_BANDS)
@@ -0,0 +1,466 @@
+import array
+import collections
+import multiprocessing
+import os
+import random
+import time
+#
+from idaclu import plg_utils
+
+
+SSDEEP_ROLLING_WINDOW = 7  # minimal common substring length required by ssdeep.compare
+PARALLEL_MIN_FUNCS = 2000  # below this the pool start-up costs more than it saves
+
+
+def get_number_ratio(num1, num2):
+    if num1 == num2:
+        return 1
+    if num1 > num2:
+        return num2 / float(num1)
+    if num1 < num2:
+        return num1 / float(num2)
+
+def split_ssdeep(digest):
+    block_size, hash_1, hash_2 = digest.split(':', 2)
+    return int(block_size), hash_1, hash_2.split(',')[0]
+
+def eliminate_sequences(hash_part):
+    # ssdeep.compare collapses runs of more than 3 identical characters
+    # before scoring, the same has to be done before n-gram extraction
+    hash_norm = []
+    for i, char in enumerate(hash_part):
+        if i < 3 or not (char == hash_part[i-1] == hash_part[i-2] == hash_part[i-3]):
+            hash_norm.append(char)
+    return ''.join(hash_norm)
+
+def get_ssdeep_grams(hash_part):
+    span = SSDEEP_ROLLING_WINDOW
+    return set(hash_part[i:i+span] for i in range(len(hash_part) - span + 1))
+
+
+def get_size_band_pairs(sizes, get_candidates=None, ratio=0.333):
+    """Yield every unordered pair of indexes within the size band once.
+
+    Indexes are swept in ascending size order and the window of each one
+    ends at the first size that breaks the ratio. If get_candidates is
+    given, only the candidates it returns for an index are visited.
+    """
+    order = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    if get_candidates is None:
+        for pos, idx in enumerate(order):
+            for nxt in range(pos + 1, len(order)):
+                jdx = order[nxt]
+                if get_number_ratio(sizes[idx], sizes[jdx]) <= ratio:
+                    break
+                yield (idx, jdx) if idx < jdx else (jdx, idx)
+    else:
+        rank = array.array('i', [0]) * len(order)
+        for pos, idx in enumerate(order):
+            rank[idx] = pos
+        for idx in order:
+            for jdx in sorted(get_candidates(idx), key=lambda j: rank[j]):
+                if rank[jdx] < rank[idx]:
+                    continue
+                if get_number_ratio(sizes[idx], sizes[jdx]) <= ratio:
+                    break
+                yield (idx, jdx) if idx < jdx else (jdx, idx)
+
+
+def get_tlsh_length(digest):
+    # log-scale length bucket of the digest, its hex digits are swapped
+    pos = 4 if digest.startswith('T1') else 2
+    value = int(digest[pos:pos + 2], 16)
+    return ((value & 0xF) << 4) | (value >> 4)
+
+def get_tlsh_band(threshold):
+    # tlsh.diff() adds 12 per length bucket apart (just 1 for adjacent
+    # ones) to the body distance, farther buckets cannot score within
+    # the threshold; buckets wrap around at 256
+    return min(max(threshold // 12, 1), 127)
+
+def get_ring_distance(num1, num2, ring=256):
+    dist = abs(num1 - num2)
+    return min(dist, ring - dist)
+
+def get_tlsh_band_pairs(digests, threshold):
+    """Yield every unordered pair of indexes of digests within the length band once.
+
+    The band is exact, pairs outside of it score above the threshold
+    whatever their bodies are. "TNULL" digests are left out.
+    """
+    buckets = collections.defaultdict(list)
+    for idx, digest in enumerate(digests):
+        if digest != "TNULL":
+            buckets[get_tlsh_length(digest)].append(idx)
+    band = get_tlsh_band(threshold)
+    for length in sorted(buckets):
+        bucket = buckets[length]
+        for pos, idx in enumerate(bucket):
+            for jdx in bucket[pos + 1:]:
+                yield idx, jdx
+        for dist in range(1, band + 1):
+            for jdx in buckets.get((length + dist) % 256, ()):
+                for idx in bucket:
+                    yield (idx, jdx) if idx < jdx else (jdx, idx)
+
+
+class DisjointSet(object):
+    """Union-find over dense function indexes with path compression."""
+
+    def __init__(self, size):
+        self.parent = array.array('i', range(size))
+        self.rank = array.array('B', [0]) * size
+
+    def find(self, idx):
+        parent = self.parent
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+
+    def union(self, idx, jdx):
+        root_i, root_j = self.find(idx), self.find(jdx)
+        if root_i == root_j:
+            return
+        if self.rank[root_i] < self.rank[root_j]:
+            root_i, root_j = root_j, root_i
+        self.parent[root_j] = root_i
+        if self.rank[root_i] == self.rank[root_j]:
+            self.rank[root_i] += 1
+
+    def get_groups(self):
+        # only non-trivial sets, ordered by their lowest index
+        groups = collections.OrderedDict()
+        for idx in range(len(self.parent)):
+            groups.setdefault(self.find(idx), []).append(idx)
+        return [grp for grp in groups.values() if len(grp) > 1]
+
+
+class PairTable(object):
+    """Matching pairs of one representation kept in flat arrays."""
+
+    def __init__(self):
+        self.scores = array.array('i')
+        self.funcs_1 = array.array('i')
+        self.funcs_2 = array.array('i')
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __iter__(self):
+        return zip(self.scores, self.funcs_1, self.funcs_2)
+
+    def append(self, score, idx, jdx):
+        self.scores.append(score)
+        self.funcs_1.append(idx)
+        self.funcs_2.append(jdx)
+
+
+class SsdeepIndex(object):
+    """Candidate index of ssdeep digests.
+
+    ssdeep.compare() scores two digests above zero only if their block sizes
+    are equal or differ twice and the hashes of the shared block size have
+    a common substring of SSDEEP_ROLLING_WINDOW characters (identical digests
+    are the only exception). Each digest is bucketed by
+    (block size, substring) for its first hash and (2 * block size, substring)
+    for its second one, so only pairs sharing a bucket have to be compared.
+    """
+
+    def __init__(self, digests):
+        self.digests = digests
+        self.buckets = collections.defaultdict(list)
+        for idx, digest in enumerate(digests):
+            for key in self.get_keys(digest):
+                self.buckets[key].append(idx)
+
+    def get_keys(self, digest):
+        block_size, hash_1, hash_2 = split_ssdeep(digest)
+        hash_1 = eliminate_sequences(hash_1)
+        hash_2 = eliminate_sequences(hash_2)
+        keys = set([(block_size, hash_1, hash_2)])
+        for gram in get_ssdeep_grams(hash_1):
+            keys.add((block_size, gram))
+        for gram in get_ssdeep_grams(hash_2):
+            keys.add((block_size * 2, gram))
+        return keys
+
+    def get_candidates(self, idx):
+        candidates = set()
+        for key in self.get_keys(self.digests[idx]):
+            candidates.update(self.buckets[key])
+        candidates.discard(idx)
+        return candidates
+
+    def get_pair_count(self):
+        return sum(len(self.get_candidates(idx)) for idx in range(len(self.digests)))
+
+
+class TlshTree(object):
+    """Vantage-point tree over TLSH digests.
+
+    Each node keeps a vantage point and the median distance to the rest of
+    its items; items within the median go to the inner subtree, the others
+    to the outer one. A radius query then descends only into subtrees that
+    can hold digests within the radius. tlsh.diff() is only approximately
+    a metric, so the search is exact only as far as the triangle inequality
+    holds for the given digests.
+    """
+
+    LEAF_SIZE = 8
+
+    def __init__(self, digests, diff):
+        self.digests = digests
+        self.diff = diff
+        self.diff_count = 0
+        # node: [vantage_point, radius, inner_node, outer_node] or [None, items]
+        self.nodes = []
+        self.root = self.build(list(range(len(digests))))
+        self.build_count = self.diff_count
+
+    def get_diff(self, idx, jdx):
+        self.diff_count += 1
+        return self.diff(self.digests[idx], self.digests[jdx])
+
+    def add_node(self, node):
+        self.nodes.append(node)
+        return len(self.nodes) - 1
+
+    def build(self, items):
+        root = self.add_node(None)
+        stack = [(root, items)]
+        while stack:
+            node, items = stack.pop()
+            if len(items) <= self.LEAF_SIZE:
+                self.nodes[node] = [None, items]
+                continue
+            vantage_point = items[0]
+            dists = [(self.get_diff(vantage_point, item), item) for item in items[1:]]
+            radius = sorted(d for d, _ in dists)[len(dists) // 2]
+            inner = self.add_node(None)
+            outer = self.add_node(None)
+            self.nodes[node] = [vantage_point, radius, inner, outer]
+            stack.append((inner, [item for d, item in dists if d <= radius]))
+            stack.append((outer, [item for d, item in dists if d > radius]))
+        return root
+
+    def query(self, idx, radius):
+        matches = {}
+        stack = [self.root]
+        while stack:
+            node = self.nodes[stack.pop()]
+            if node[0] is None:
+                for item in node[1]:
+                    if item != idx:
+                        dist = self.get_diff(idx, item)
+                        if dist <= radius:
+                            matches[item] = dist
+                continue
+            vantage_point, node_radius, inner, outer = node
+            dist = self.get_diff(idx, vantage_point) if vantage_point != idx else 0
+            if dist <= radius and vantage_point != idx:
+                matches[vantage_point] = dist
+            if dist - radius <= node_radius:
+                stack.append(inner)
+            if dist + radius > node_radius:
+                stack.append(outer)
+        return matches
+
+
+# This module is imported by pool workers as well,
+# hence it must not depend on the IDA API.
+_worker_data = {}
+
+def init_scoring_worker(kind, data_type, digests, sizes):
+    _worker_data['kind'] = kind
+    _worker_data['data_type'] = data_type
+    _worker_data['digests'] = digests
+    _worker_data['sizes'] = sizes
+    if kind == 'ssdeep':
+        import ssdeep
+        _worker_data['diff'] = ssdeep.compare
+        _worker_data['index'] = dict((dt, SsdeepIndex(digests[dt])) for (dt, th) in data_type)
+    elif kind == 'tlsh':
+        import tlsh
+        _worker_data['diff'] = tlsh.diff
+        _worker_data['lengths'] = dict(
+            (dt, [get_tlsh_length(d) if d != "TNULL" else None for d in digests[dt]]) for (dt, th) in data_type)
+
+def is_score_match(kind, score, threshold):
+    if kind == 'ssdeep':
+        return score and score > threshold
+    elif kind == 'tlsh':
+        return score and score <= threshold
+
+def score_rows(rows):
+    kind = _worker_data['kind']
+    diff = _worker_data['diff']
+    digests = _worker_data['digests']
+    sizes = _worker_data['sizes']
+    pairs = []
+    visits = collections.defaultdict(int)
+    for (dt, th) in _worker_data['data_type']:
+        dt_digests = digests[dt]
+        dt_sizes = sizes[dt]
+        if kind == 'tlsh':
+            dt_lengths = _worker_data['lengths'][dt]
+            band = get_tlsh_band(th)
+        for idx in range(*rows):
+            if kind == 'ssdeep':
+                candidates = sorted(j for j in _worker_data['index'][dt].get_candidates(idx) if j > idx)
+            else:
+                candidates = range(idx + 1, len(dt_digests))
+            for jdx in candidates:
+                if kind == 'ssdeep':
+                    if get_number_ratio(dt_sizes[idx], dt_sizes[jdx]) <= 0.333:
+                        continue
+                elif dt_lengths[idx] is None or dt_lengths[jdx] is None:
+                    continue
+                elif get_ring_distance(dt_lengths[idx], dt_lengths[jdx]) > band:
+                    continue
+                visits[dt] += 1
+                score = diff(dt_digests[idx], dt_digests[jdx])
+                if is_score_match(kind, score, th):
+                    pairs.append((dt, th, score, idx, jdx))
+    return pairs, dict(visits)
+
+def get_triangle_chunks(count, chunk_count):
+    # row 'i' of the upper triangle holds 'count - 1 - i' pairs
+    chunk_pairs = max(count * (count - 1) // 2 // max(chunk_count, 1), 1)
+    chunks = []
+    beg, pairs = 0, 0
+    for idx in range(count):
+        pairs += count - 1 - idx
+        if pairs >= chunk_pairs:
+            chunks.append((beg, idx + 1))
+            beg, pairs = idx + 1, 0
+    if beg < count:
+        chunks.append((beg, count))
+    return chunks
+
+def get_scoring_pool(kind, data_type, func_descriptors):
+    """Start a pool scoring the upper triangle of the pair matrix.
+
+    Only digests and sizes are shipped to the workers. None is returned
+    when the function count is too small or processes cannot be spawned,
+    the caller is expected to fall back to serial scoring.
+    """
+    if len(func_descriptors) < PARALLEL_MIN_FUNCS:
+        return None
+
+    digests, sizes = {}, {}
+    for (dt, th) in data_type:
+        digests[dt] = [fd['{}_hash'.format(dt)] for fd in func_descriptors]
+        sizes[dt] = [fd['{}_size'.format(dt)] for fd in func_descriptors]
+
+    return plg_utils.get_process_pool(
+        os.path.dirname(os.path.abspath(__file__)),
+        init_scoring_worker, (kind, data_type, digests, sizes))
+
+def get_func_pairs_parallel(pool, func_count, stat):
+    chunks = get_triangle_chunks(func_count, multiprocessing.cpu_count() * 16)
+    try:
+        for pairs, visits in pool.imap_unordered(score_rows, chunks):
+            for dt, count in visits.items():
+                stat['pairs_{}'.format(dt)] += count
+            for pair in pairs:
+                yield pair
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def init_hashing_worker(kind, snapshot):
+    _worker_data['reader'] = plg_utils.SnapshotReader(snapshot)
+    if kind == 'ssdeep':
+        import ssdeep
+        _worker_data['hash'] = ssdeep.hash
+    elif kind == 'tlsh':
+        import tlsh
+        _worker_data['hash'] = tlsh.hash
+
+def hash_func_bytes(index_range):
+    reader = _worker_data['reader']
+    hash_func = _worker_data['hash']
+    func_hashes = [hash_func(reader.get_func_bytes(idx).tobytes()) for idx in range(*index_range)]
+    return index_range[0], func_hashes
+
+def get_byts_hashes_parallel(kind, snapshot):
+    """Hash function bytes in worker processes reading them from a snapshot.
+
+    None is returned when processes cannot be spawned, the caller is
+    expected to hash the bytes itself.
+    """
+    func_count = len(snapshot['funcs'])
+    pool = plg_utils.get_process_pool(
+        os.path.dirname(os.path.abspath(__file__)),
+        init_hashing_worker, (kind, snapshot))
+    if pool is None:
+        return None
+
+    func_hashes = [None] * func_count
+    index_ranges = plg_utils.get_index_chunks(func_count, multiprocessing.cpu_count() * 8)
+    try:
+        for beg, range_hashes in pool.imap_unordered(hash_func_bytes, index_ranges):
+            func_hashes[beg:beg + len(range_hashes)] = range_hashes
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return func_hashes
+
+
+def get_synthetic_blobs(count, seed=0, family_size=4):
+    rng = random.Random(seed)
+    blobs = []
+    while len(blobs) < count:
+        base = bytearray(rng.getrandbits(8) for _ in range(rng.randint(512, 4096)))
+        for _ in range(min(family_size, count - len(blobs))):
+            blob = bytearray(base)
+            for _ in range(rng.randint(0, 16)):
+                blob[rng.randrange(len(blob))] = rng.getrandbits(8)
+            blobs.append(bytes(blob))
+    return blobs
+
+def benchmark(counts=(1000, 10000, 100000), sample_size=1000):
+    import ssdeep
+
+    row_fmt = "{:>8} {:>16} {:>12} {:>14} {:>10} {:>10}"
+    print(row_fmt.format('funcs', 'pairs (before)', 'time (s)', 'pairs (after)', 'time (s)', 'matches'))
+    for count in counts:
+        digests = [ssdeep.hash(blob) for blob in get_synthetic_blobs(count)]
+
+        # all-pairs timing is extrapolated from a sample for large counts
+        pairs_before = count * (count - 1)
+        sample = digests[:min(count, sample_size)]
+        time_beg = time.time()
+        matches_before = set()
+        for idx, sup in enumerate(sample):
+            for jdx, sub in enumerate(sample):
+                if idx != jdx and ssdeep.compare(sup, sub):
+                    matches_before.add((idx, jdx))
+        sample_pairs = len(sample) * (len(sample) - 1)
+        time_before = (time.time() - time_beg) * pairs_before / float(sample_pairs)
+
+        time_beg = time.time()
+        index = SsdeepIndex(digests)
+        pairs_after = 0
+        matches_after = set()
+        for idx, sup in enumerate(digests):
+            for jdx in index.get_candidates(idx):
+                pairs_after += 1
+                if ssdeep.compare(sup, digests[jdx]):
+                    matches_after.add((idx, jdx))
+        time_after = time.time() - time_beg
+
+        sample_count = len(sample)
+        matches_after_sample = set(p for p in matches_after if p[0] < sample_count and p[1] < sample_count)
+        assert matches_before == matches_after_sample, "index missed scoring pairs"
+
+        time_fmt = "{:.2f}{}".format(time_before, '' if count <= sample_size else '*')
+        print(row_fmt.format(count, pairs_before, time_fmt, pairs_after, "{:.2f}".format(time_after), len(matches_after)))
+    print("* extrapolated from {} sampled functions".format(sample_size))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -5,6 +5,7 @@ import re
 import idautils
 import idaapi
 #
+from idaclu import feature_store
 from idaclu import ida_shims
 from idaclu import ida_utils
 from idaclu.qt_utils import i18n
@@ -34,27 +35,6 @@ def order_item_len(input_dict):
 
     return collections.OrderedDict(sorted(input_dict.items(), key=get_len, reverse=True))
 
-def get_psdo_list(func_ea):
-    func_pseudocode = []
-    decomp_str = ""
-    try:
-       decomp_str = idaapi.decompile(func_ea)
-    except idaapi.DecompilationFailure:
-       return []
-    for line in str(decomp_str).split('\n'):
-        if '//' in line:
-            code = line.split('//')[0]
-            if code != '':
-                func_pseudocode.append(code.lstrip())
-        else:
-            if line != '':
-                func_pseudocode.append(line.lstrip())
-    return func_pseudocode
-    
-def get_psdo_body(func_ea):
-    psdo_list = get_psdo_list(func_ea)
-    return psdo_list[2:-1]
- 
 def get_data(func_gen=None, env_desc=None, plug_params=None):
 
     report = {
@@ -67,9 +47,12 @@ def get_data(func_gen=None, env_desc=None, plug_params=None):
     is_std_add = plug_params['func_calls'][2][1]
     is_usr_add = plug_params['func_calls'][3][1]
 
+    skipped = []
     for func_addr in func_gen():
         caller_name = idaapi.get_func_name(func_addr)
-        caller_psdo = get_psdo_body(func_addr)
+        caller_psdo = feature_store.get_psdo_body(func_addr)
+        if feature_store.is_psdo_skipped(func_addr, skipped):
+            continue
 
         for psdo_line in caller_psdo:
             is_func_matched = re.match('(?:(?:.*\s)?)([0-9a-zA-Z\_\:]+)\(.*\)(?:(?:.*)?)', psdo_line)  # (?:(?:.*\s)?)([0-9a-zA-Z\_\:]+)\(.*\)
@@ -88,6 +71,8 @@ def get_data(func_gen=None, env_desc=None, plug_params=None):
     report['data'] = order_item_len(report['data'])
     report['stat'] = order_item_len(report['stat'])
 
+    feature_store.add_psdo_skipped(report, skipped)
+
     return report if __name__ == '__main__' else report['data']
 
 def debug():
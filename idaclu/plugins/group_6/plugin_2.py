@@ -5,6 +5,7 @@ import re
 import idautils
 import idaapi
 #
+from idaclu import feature_store
 from idaclu import ida_shims
 from idaclu.qt_utils import i18n
 
@@ -25,27 +26,6 @@ def order_item_len(input_dict):
 
     return collections.OrderedDict(sorted(input_dict.items(), key=get_len, reverse=True))
 
-def get_psdo_list(func_ea):
-    func_pseudocode = []
-    decomp_str = ""
-    try:
-        decomp_str = idaapi.decompile(func_ea)
-    except idaapi.DecompilationFailure:
-        return []
-    for line in str(decomp_str).split('\n'):
-        if '//' in line:
-            code = line.split('//')[0]
-            if code != '':
-                func_pseudocode.append(code.lstrip())
-        else:
-            if line != '':
-                func_pseudocode.append(line.lstrip())
-    return func_pseudocode
-
-def get_psdo_body(func_ea):
-    psdo_list = get_psdo_list(func_ea)
-    return psdo_list[2:-1]
-
 def remove_casts(call_str):
     call_res = call_str
     for m in re.finditer('\(\*(\([a-zA-Z0-9_\s\*\,\.\(\)]+\)\))\(', call_res):
@@ -60,9 +40,12 @@ def get_data(func_gen=None, env_desc=None, plug_params=None):
         'stat': collections.defaultdict(int)
     }
 
+    skipped = []
     for func_addr in func_gen():
         caller_name = idaapi.get_func_name(func_addr)
-        caller_psdo = get_psdo_body(func_addr)
+        caller_psdo = feature_store.get_psdo_body(func_addr)
+        if feature_store.is_psdo_skipped(func_addr, skipped):
+            continue
 
         psdo_size = len(caller_psdo)
 
@@ -86,6 +69,8 @@ def get_data(func_gen=None, env_desc=None, plug_params=None):
     report['data'] = order_item_len(report['data'])
     report['stat'] = order_item_len(report['stat'])
 
+    feature_store.add_psdo_skipped(report, skipped)
+
     return report if __name__ == '__main__' else report['data']
 
 def debug():
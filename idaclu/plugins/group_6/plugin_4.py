@@ -6,6 +6,7 @@ import idautils
 import idaapi
 import idc
 #
+from idaclu import feature_store
 from idaclu import ida_shims
 from idaclu import ida_utils
 from idaclu.qt_utils import i18n
@@ -38,8 +39,11 @@ def get_data(func_gen=None, env_desc=None, plug_params=None):
     is_v_add = plug_params['call_types'][1][1]
 
     merged_calls = collections.defaultdict(dict)
+    skipped = []
     for func_addr in func_gen():
-        func_calls = ida_utils.extract_calls_from_decompiled(func_addr)
+        func_calls = feature_store.get_psdo_calls(func_addr)
+        if feature_store.is_psdo_skipped(func_addr, skipped):
+            continue
         for callee_addr, call_descs in func_calls.items():  # call_descs = [(pos, args)]
             if idaapi.get_func(callee_addr):
                 merged_calls[callee_addr].update(call_descs)
@@ -74,6 +78,8 @@ def get_data(func_gen=None, env_desc=None, plug_params=None):
     report['data'] = order_item_len(report['data'])
     report['stat'] = order_item_len(report['stat'])
 
+    feature_store.add_psdo_skipped(report, skipped)
+
     return report if __name__ == '__main__' else report['data']
 
 def debug():
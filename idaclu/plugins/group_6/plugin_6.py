@@ -2,9 +2,9 @@ import collections
 import json
 import re
 #
-import idaapi
 import idautils
 #
+from idaclu import feature_store
 from idaclu import ida_shims
 from idaclu.qt_utils import i18n
 
@@ -15,14 +15,8 @@ SCRIPT_VIEW = 'tree'
 SCRIPT_ARGS = []
 
 
-def get_psdo_str(func_ea):
-    try:
-       return str(idaapi.decompile(func_ea))  # restored microcode/pseudocode from idb
-    except idaapi.DecompilationFailure:
-       return ""
-    
 def get_lost_mem(func_ea):
-    psdo_str = get_psdo_str(func_ea)
+    psdo_str = feature_store.get_psdo_str(func_ea)
     pattern = r"MEMORY\[0x[0-9A-Fa-f]+\]|[0-9A-Za-z]+\->\?"  
     # Find cases like: `MEMORY[0x0040105C]`, `entity3->?`
     return re.findall(pattern, psdo_str)
@@ -33,12 +27,18 @@ def get_data(func_gen=None, env_desc=None, plug_params=None):
         'stat': collections.defaultdict(int)
     }
 
+    skipped = []
     for func_addr in func_gen():
-        for lost_mem in get_lost_mem(func_addr):
+        func_lost = get_lost_mem(func_addr)
+        if feature_store.is_psdo_skipped(func_addr, skipped):
+            continue
+        for lost_mem in func_lost:
             if not func_addr in report['data'][lost_mem]:
                 report['data'][lost_mem].append(func_addr)
                 report['stat'][lost_mem] += 1
 
+    feature_store.add_psdo_skipped(report, skipped)
+
     return report if __name__ == '__main__' else report['data']
 
 def debug():
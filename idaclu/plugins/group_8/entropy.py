@@ -0,0 +1,128 @@
+import collections
+import math
+#
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+ENTROPY_WINDOW = 256  # bytes per sliding window
+ENTROPY_STEP = 64  # bytes between the starts of neighbouring windows
+ENTROPY_BATCH = 16 * 1024 * 1024  # bytes histogrammed at once
+ENTROPY_BANDS = [  # (name, bits per byte), first match wins
+    ('entropy 7-8 bits', 7.0),
+    ('entropy 6-7 bits', 6.0),
+    ('entropy 5-6 bits', 5.0),
+    ('entropy 4-5 bits', 4.0),
+    ('entropy 0-4 bits', 0.0)
+]
+
+
+def get_entropy(data):
+    byte_count = collections.Counter(bytearray(data))
+    total_bytes = float(len(data))
+    entropy = 0.0
+    for count in byte_count.values():
+        probability = count / total_bytes
+        entropy -= probability * math.log(probability, 2)
+    return entropy
+
+def get_entropy_lut(total):
+    # -p*log2(p) of every possible count of a byte value among 'total' bytes
+    probs = np.arange(total + 1, dtype=np.float64) / total
+    lut = np.zeros(total + 1, dtype=np.float64)
+    lut[1:] = -probs[1:] * np.log2(probs[1:])
+    return lut
+
+def get_row_entropies(counts):
+    totals = counts.sum(axis=1).astype(np.float64)
+    probs = counts / np.maximum(totals, 1)[:, None]
+    terms = np.zeros_like(probs)
+    np.log2(probs, out=terms, where=probs > 0)
+    return -(probs * terms).sum(axis=1)
+
+
+def get_func_entropies(func_views):
+    """Get the byte entropy of each function buffer.
+
+    Buffers are joined into batches and histogrammed by a single
+    bincount over (function, byte value) keys per batch.
+    """
+    if np is None:
+        return [get_entropy(func_view) if len(func_view) else 0.0 for func_view in func_views]
+
+    func_entropies = np.zeros(len(func_views), dtype=np.float64)
+    batch_beg = 0
+    while batch_beg < len(func_views):
+        batch_end = batch_beg
+        batch_size = 0
+        while batch_end < len(func_views) and (batch_size < ENTROPY_BATCH or batch_end == batch_beg):
+            batch_size += len(func_views[batch_end])
+            batch_end += 1
+        batch_lens = [len(v) for v in func_views[batch_beg:batch_end]]
+        batch_data = np.frombuffer(b''.join(func_views[batch_beg:batch_end]), dtype=np.uint8)
+        batch_keys = np.repeat(np.arange(batch_end - batch_beg, dtype=np.int64) * 256, batch_lens)
+        batch_keys += batch_data
+        counts = np.bincount(batch_keys, minlength=(batch_end - batch_beg) * 256)
+        func_entropies[batch_beg:batch_end] = get_row_entropies(counts.reshape(-1, 256))
+        batch_beg = batch_end
+    return func_entropies
+
+def get_window_entropies(data, window=ENTROPY_WINDOW, step=ENTROPY_STEP):
+    """Get (window starts, window entropies) of the sliding windows over a buffer.
+
+    The windows are strided views of the buffer, so a whole segment is
+    processed without copying it.
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) < window:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+    window_count = (len(data) - window) // step + 1
+    if window % step:
+        block_span = 1
+        blocks = np.lib.stride_tricks.as_strided(
+            data, shape=(window_count, window), strides=(step * data.strides[0], data.strides[0]))
+    else:
+        # a window is a run of whole steps, its histogram is a sum of
+        # the step histograms, so each byte is counted once
+        block_span = window // step
+        blocks = data[:(window_count + block_span - 1) * step].reshape(-1, step)
+    lut = get_entropy_lut(window)
+    entropies = np.empty(window_count, dtype=np.float64)
+    batch_count = max(1, ENTROPY_BATCH // (256 * 8))  # windows per batch
+    for batch_beg in range(0, window_count, batch_count):
+        batch_len = min(batch_count, window_count - batch_beg)
+        batch = blocks[batch_beg:batch_beg + batch_len + block_span - 1]
+        keys = (np.arange(len(batch), dtype=np.int32) * 256)[:, None] + batch
+        counts = np.bincount(keys.ravel(), minlength=len(batch) * 256).reshape(-1, 256)
+        window_counts = counts[:batch_len]
+        for block_idx in range(1, block_span):
+            window_counts = window_counts + counts[block_idx:block_idx + batch_len]
+        entropies[batch_beg:batch_beg + batch_len] = np.take(lut, window_counts).sum(axis=1)
+    return np.arange(window_count, dtype=np.int64) * step, entropies
+
+def update_window_max(window_max, window_starts, window_entropies, chunk_index, window=ENTROPY_WINDOW):
+    """Raise the maximum window entropy of the functions owning the windows.
+
+    'chunk_index' is (begs, ends, owners) of the sorted, non-overlapping
+    function chunks, only windows lying entirely inside a chunk count.
+    """
+    chunk_begs, chunk_ends, chunk_owners = chunk_index
+    index = np.searchsorted(chunk_begs, window_starts, side='right') - 1
+    is_inside = index >= 0
+    index = index[is_inside]
+    window_entropies = window_entropies[is_inside]
+    is_inside = window_starts[is_inside] + window <= chunk_ends[index]
+    np.maximum.at(window_max, chunk_owners[index[is_inside]], window_entropies[is_inside])
+
+def get_window_max(data, window=ENTROPY_WINDOW, step=ENTROPY_STEP):
+    # single-buffer fallback without numpy
+    return max(get_entropy(data[beg:beg + window])
+               for beg in range(0, len(data) - window + 1, step))
+
+def get_band(entropy):
+    for band_name, band_bits in ENTROPY_BANDS:
+        if entropy >= band_bits:
+            return band_name
@@ -1,10 +1,10 @@
 import collections
 import math
 #
-import idc
 import idaapi
 import idautils
 #
+from idaclu import feature_store
 from idaclu import ida_shims
 #
 from ngrams import determine_ngram_database
@@ -55,7 +55,7 @@ BOOLEAN_OPERATION_ASG = set([
 def calc_flattening_score(function):
     score = 0.0
     # 0: get the basic blocks of the function
-    basic_blocks = idaapi.FlowChart(idaapi.get_func(function))
+    basic_blocks = feature_store.get_flowchart(function)
     # 1: walk over all basic blocks
     for block in basic_blocks:
         # 2: get all blocks that are dominated by the current block
@@ -83,20 +83,6 @@ def get_dominated_by(dominator):
                 worklist.append(child)
     return worked_on_eas
 
-def calculate_entropy(data):
-    # count byte occurrences and calculate total bytes
-    byte_count = collections.Counter(data)
-    total_bytes = len(data)
-
-    # calculate entropy using the counted byte occurrences
-    entropy = 0.0
-    for count in byte_count.values():
-        # calculate byte probability and update entropy
-        probability = count / total_bytes
-        entropy -= probability * math.log2(probability)
-
-    return entropy
-
 def get_top_10_functions(functions, scoring_function):
     # sort functions by scoring function
     sorted_functions = sorted(((f, scoring_function(f))
@@ -121,7 +107,7 @@ def calc_cyclomatic_complexity(func_addr):
     
     num_blocks = 0
     num_edges = 0
-    basic_blocks = idaapi.FlowChart(idaapi.get_func(func_addr), flags=(idaapi.FC_PREDS | idaapi.FC_NOEXT))
+    basic_blocks = feature_store.get_flowchart(func_addr, idaapi.FC_PREDS | idaapi.FC_NOEXT)
     for block in basic_blocks:
         for succ_block in block.succs():
             child.add(succ_block.id)     
@@ -136,7 +122,7 @@ def calc_cyclomatic_complexity(func_addr):
 
 def calc_average_instructions_per_block(function):
     # number of basic blocks -- set to 1 if 0
-    basic_blocks = idaapi.FlowChart(idaapi.get_func(function))
+    basic_blocks = feature_store.get_flowchart(function)
     num_blocks = max(1, basic_blocks.size)
     # number of instructions
     num_instructions = sum(
@@ -162,7 +148,7 @@ def computes_xor_const(insn):
 
 def contains_xor_decryption_loop(function):
     # walk over all blocks which are part of a loop
-    basic_blocks = idaapi.FlowChart(idaapi.get_func(function))
+    basic_blocks = feature_store.get_flowchart(function)
     for block in basic_blocks:
         if not block_is_in_loop(block):
             continue
@@ -185,9 +171,7 @@ def sliding_window(l, window_size):
         yield l[index:index + window_size]
 
 def calc_ngrams(function, n):
-    fn = idaapi.get_func(function)
-    hi = [h for h in fn.head_items()]
-    mnemonics_sorted = [idc.print_insn_mnem(ea) for ea in hi]
+    mnemonics_sorted = feature_store.get_item_mnems(function)
 
     # calculate all n-grams
     grams_n = collections.Counter(["".join(w) for w in sliding_window(mnemonics_sorted, n)])
@@ -220,7 +204,7 @@ def get_basic_blocks(func_addr, is_attached):
     child = set([])
 
     # ignore external blocks referenced by the function!
-    basic_blocks = idaapi.FlowChart(idaapi.get_func(func_addr), flags=(idaapi.FC_PREDS | idaapi.FC_NOEXT))  
+    basic_blocks = feature_store.get_flowchart(func_addr, idaapi.FC_PREDS | idaapi.FC_NOEXT)  
     for block in basic_blocks:
         for succ_block in block.succs():
             child.add(succ_block.id)     
@@ -272,7 +256,7 @@ class MbaVisitor(idaapi.ctree_visitor_t):
             self.list_parents('a')
         return 0
 
-def calculate_complex_arithmetic_expressions(function):  
+def count_complex_arithmetic_expressions(function):
     instr_mba = 0
     cfunc = idaapi.decompile(function)
     if cfunc:
@@ -282,3 +266,6 @@ def calculate_complex_arithmetic_expressions(function):
         if len(mba_visitor.mba_eas):
             instr_mba = len(mba_visitor.mba_eas)
     return instr_mba
+
+def calculate_complex_arithmetic_expressions(function):
+    return feature_store.get_psdo_summary(function, 'mba', count_complex_arithmetic_expressions, 0)
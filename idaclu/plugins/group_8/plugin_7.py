@@ -5,6 +5,7 @@ import re
 import idaapi
 import idautils
 #
+from idaclu import feature_store
 from idaclu import ida_shims
 from idaclu.qt_utils import i18n
 #
@@ -34,8 +35,11 @@ def get_data(func_gen=None, env_desc=None, plug_params=None):
         'stat': collections.defaultdict(int)
     }
 
+    skipped = []
     for func_addr in func_gen():
         compl_score = helpers.calculate_complex_arithmetic_expressions(func_addr)
+        if feature_store.is_psdo_skipped(func_addr, skipped):
+            continue
 
         compl_key = "score: {}".format(compl_score)
 
@@ -45,6 +49,8 @@ def get_data(func_gen=None, env_desc=None, plug_params=None):
     report['data'] = sort_nat(report['data'])
     report['stat'] = sort_nat(report['stat'])
 
+    feature_store.add_psdo_skipped(report, skipped)
+
     return report if __name__ == '__main__' else report['data']
 
 
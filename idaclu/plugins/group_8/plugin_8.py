@@ -0,0 +1,92 @@
+import collections
+import json
+#
+import idautils
+#
+from idaclu import ida_shims
+from idaclu import ida_utils
+from idaclu.qt_utils import i18n
+#
+import entropy
+
+
+SCRIPT_NAME = i18n('High Entropy Functions')
+SCRIPT_TYPE = 'func'
+SCRIPT_VIEW = 'tree'
+SCRIPT_ARGS = []
+
+
+def get_chunk_index(func_chunks):
+    chunks = sorted((beg, end, idx) for idx, chunks in enumerate(func_chunks) for beg, end in chunks)
+    # a tail shared by several functions is attributed to the first one
+    chunks = [c for i, c in enumerate(chunks) if i == 0 or c[0] >= chunks[i - 1][1]]
+    return (
+        entropy.np.array([c[0] for c in chunks], dtype=entropy.np.int64),
+        entropy.np.array([c[1] for c in chunks], dtype=entropy.np.int64),
+        entropy.np.array([c[2] for c in chunks], dtype=entropy.np.int64)
+    )
+
+def get_entropies(func_addrs, func_chunks):
+    """Get (function entropies, maximum window entropies) of the functions.
+
+    Windows are scanned over whole segment buffers at once, a function
+    shorter than a window gets its own entropy as the maximum.
+    """
+    func_views = [ida_utils.get_func_bytes(func_addr) for func_addr in func_addrs]
+    func_entropies = entropy.get_func_entropies(func_views)
+    if entropy.np is None:
+        window_max = [entropy.get_window_max(func_view) if len(func_view) >= entropy.ENTROPY_WINDOW else func_ent
+                      for func_view, func_ent in zip(func_views, func_entropies)]
+        return func_entropies, window_max
+
+    window_max = entropy.np.array(func_entropies, dtype=entropy.np.float64)
+    is_long = entropy.np.array([len(v) >= entropy.ENTROPY_WINDOW for v in func_views], dtype=bool)
+    window_max[is_long] = 0.0
+    chunk_index = get_chunk_index(func_chunks)
+    seg_begs = set()
+    for beg in chunk_index[0]:
+        seg_beg, seg_view = ida_utils.get_segment_buffer(int(beg))
+        if seg_view is None or seg_beg in seg_begs:
+            continue
+        seg_begs.add(seg_beg)
+        window_starts, window_entropies = entropy.get_window_entropies(seg_view)
+        entropy.update_window_max(window_max, window_starts + seg_beg, window_entropies, chunk_index)
+    # long functions made of chunks shorter than a window
+    is_missed = is_long & (window_max == 0.0)
+    window_max[is_missed] = entropy.np.asarray(func_entropies)[is_missed]
+    return func_entropies, window_max
+
+def get_data(func_gen=None, env_desc=None, plug_params=None):
+
+    report = {
+        'data': collections.defaultdict(list),
+        'stat': collections.defaultdict(int)
+    }
+
+    func_addrs = []
+    func_chunks = []
+    for func_addr in func_gen():
+        func_addrs.append(func_addr)
+        func_chunks.append(list(idautils.Chunks(func_addr)))
+
+    func_entropies, window_max = get_entropies(func_addrs, func_chunks)
+    for func_addr, func_ent, window_ent in zip(func_addrs, func_entropies, window_max):
+        # a packed or encrypted blob inside a function stands out in its windows,
+        # a small window cannot reach the entropy of a large random function
+        band_name = entropy.get_band(max(func_ent, window_ent))
+        func_comment = "entropy {:.2f}, window max {:.2f}".format(func_ent, window_ent)
+        report['data'][band_name].append((func_addr, func_comment))
+        report['stat'][band_name] += 1
+
+    band_names = [band_name for band_name, _ in entropy.ENTROPY_BANDS]
+    report['data'] = collections.OrderedDict(
+        (band_name, report['data'][band_name]) for band_name in band_names if band_name in report['data'])
+
+    return report if __name__ == '__main__' else report['data']
+
+def debug():
+    data_obj = get_data(func_gen=idautils.Functions)
+    ida_shims.msg(json.dumps(data_obj, indent=4))
+
+if __name__ == '__main__':
+    debug()
@@ -1,30 +1,189 @@
+import bisect
 import collections
+import hashlib
 import json
 import os
 import re
+import time
 #
 import yara
 #
 import idaapi
 import idautils
+import idc
 #
 from idaclu import ida_shims
+from idaclu import ida_utils
+from idaclu import plg_utils
 from idaclu.qt_utils import i18n
+#
+import rule_match
 
 
 SCRIPT_NAME = i18n('Rule Match')
 SCRIPT_TYPE = 'func'
 SCRIPT_VIEW = 'tree'
-SCRIPT_ARGS = [('filePath', 'file_path', 'path to folder with .yar files')]
+SCRIPT_ARGS = [
+    ('textedit', 'file_path', ['path to folder with .yar files']),
+    ('checkbox', 'mode', ['Scan Segments'])
+]
+
+INCLUDE_RE = re.compile(r'^\s*include\s+"([^"]+)"', re.MULTILINE)
+
+
+def get_rule_paths(dist_path):
+    return sorted(
+        os.path.join(dist_path, f)
+        for f in os.listdir(dist_path)
+        if os.path.isfile(os.path.join(dist_path, f)) and f.endswith('.yar')
+    )
+
+def get_rule_deps(yar_path, deps):
+    # files included by a rule file, followed recursively
+    try:
+        with open(yar_path, 'rb') as yar_file:
+            yar_text = yar_file.read().decode('utf-8', 'replace')
+    except (IOError, OSError):
+        return
+    for inc_path in INCLUDE_RE.findall(yar_text):
+        inc_path = os.path.normpath(os.path.join(os.path.dirname(yar_path), inc_path))
+        if inc_path not in deps:
+            deps.add(inc_path)
+            get_rule_deps(inc_path, deps)
+
+def get_rules_key(yar_paths):
+    # compiled rules are tied to the rule files, the files they include
+    # and the libyara version
+    deps = set()
+    for p in yar_paths:
+        get_rule_deps(p, deps)
+    rules_desc = [yara.__version__]
+    for p in yar_paths + sorted(deps.difference(yar_paths)):
+        try:
+            p_stat = os.stat(p)
+        except OSError:
+            rules_desc.append([p, None])
+            continue
+        rules_desc.append([p, int(p_stat.st_mtime), p_stat.st_size])
+    return hashlib.md5(json.dumps(rules_desc).encode('utf-8')).hexdigest()
+
+def compile_rules(yar_paths):
+    # one namespace per file, so that equally named rules do not clash
+    filepaths = dict((os.path.basename(p), p) for p in yar_paths)
+    try:
+        return yara.compile(filepaths=filepaths)
+    except yara.Error:
+        pass
+
+    # a broken file fails the whole compilation, leave it out
+    for n, p in list(filepaths.items()):
+        try:
+            yara.compile(filepath=p)
+        except yara.Error as e:
+            ida_shims.msg("Error compiling rule '{}': {}\n".format(n, e))
+            del filepaths[n]
+    return yara.compile(filepaths=filepaths) if len(filepaths) else None
+
+def get_rules(yar_paths):
+    """Get all the rule files compiled into a single multi-namespace object.
+
+    The compiled rules are saved next to the IDB and loaded back as long
+    as none of the rule files or the files they include was added,
+    removed or changed. Returns (rules, path of the saved rules or None
+    if saving failed).
+    """
+    idb_path = ida_shims.get_idb_path()
+    idb_name = os.path.splitext(os.path.basename(idb_path))[0]
+    rules_path = os.path.join(os.path.dirname(idb_path), "{}_idaclu_yara.bin".format(idb_name))
+    key_path = "{}.key".format(rules_path)
+    rules_key = get_rules_key(yar_paths)
+
+    if os.path.isfile(rules_path) and os.path.isfile(key_path):
+        with open(key_path, "r") as key_file:
+            if key_file.read() == rules_key:
+                try:
+                    return yara.load(rules_path), rules_path
+                except yara.Error:
+                    pass
 
+    yara_rules = compile_rules(yar_paths)
+    if yara_rules:
+        try:
+            yara_rules.save(rules_path)
+            with open(key_path, "w") as key_file:
+                key_file.write(rules_key)
+        except (IOError, OSError, yara.Error):
+            return yara_rules, None
+    return yara_rules, rules_path
+
+def get_func_matches(yara_rules, rules_path, func_addrs):
+    # many functions are matched in worker processes reading a snapshot
+    # of the segment bytes, the workers load the saved rules
+    if rules_path and len(func_addrs) >= rule_match.PARALLEL_MIN_FUNCS:
+        snapshot = ida_utils.write_segment_snapshot(func_addrs)
+        try:
+            func_matches = rule_match.get_func_matches_parallel(rules_path, snapshot)
+        finally:
+            plg_utils.remove_snapshot(snapshot)
+        if func_matches is not None:
+            return func_matches
+
+    func_matches = []
+    for func_addr in func_addrs:
+        time_beg = time.time()
+        matches = yara_rules.match(data=ida_utils.get_func_bytes(func_addr))
+        func_matches.append((func_addr, rule_match.get_rule_names(matches), time.time() - time_beg))
+    return func_matches
+
+def get_chunk_index(func_gen):
+    # chunk ranges sorted by start, a tail chunk shared by several
+    # functions is a single range owned by all of them
+    chunk_owners = collections.defaultdict(list)
+    for func_addr in func_gen():
+        for chunk in idautils.Chunks(func_addr):
+            chunk_owners[tuple(chunk)].append(func_addr)
+    chunk_ranges = sorted(chunk_owners)
+    return [r[0] for r in chunk_ranges], chunk_ranges, chunk_owners
+
+def find_functions(addr, chunk_index):
+    chunk_begs, chunk_ranges, chunk_owners = chunk_index
+    idx = bisect.bisect_right(chunk_begs, addr) - 1
+    if idx >= 0 and addr < chunk_ranges[idx][1]:
+        return chunk_owners[chunk_ranges[idx]]
+    return []
+
+def get_exec_segments():
+    for seg_ea in idautils.Segments():
+        seg_perm = ida_shims.get_segm_attr(seg_ea, idc.SEGATTR_PERM)
+        # segments of some loaders have no permissions set
+        if seg_perm & idaapi.SEGPERM_EXEC or ida_shims.get_segm_attr(seg_ea, idc.SEGATTR_TYPE) == idc.SEG_CODE:
+            yield seg_ea
+
+def get_match_offsets(match):
+    # yara-python 4.3 replaced the (offset, identifier, data) tuples with objects
+    for string_match in match.strings:
+        if isinstance(string_match, tuple):
+            yield string_match[0]
+        else:
+            for instance in string_match.instances:
+                yield instance.offset
+
+def get_segment_matches(yara_rules, chunk_index):
+    """Scan each executable segment once and map the string matches to functions.
+
+    A rule is attributed to every function one of its strings matched in,
+    rules without strings cannot be attributed and are not reported.
+    """
+    rule_funcs = collections.defaultdict(set)
+    for seg_ea in get_exec_segments():
+        seg_beg, seg_data = ida_utils.get_segment_buffer(seg_ea)
+        if not seg_data:
+            continue
+        for match in yara_rules.match(data=seg_data):
+            for offset in get_match_offsets(match):
+                rule_funcs[rule_match.get_rule_name(match)].update(find_functions(seg_beg + offset, chunk_index))
+    return rule_funcs
 
-def get_func_bytes(func_addr):
-    func_bytes = b''
-    for beg, end in idautils.Chunks(func_addr):
-        fb = ida_shims.get_bytes(beg, end-beg)
-        func_bytes += fb
-    return func_bytes
-    
 def order_item_len(input_dict):
     def get_len(val):
         fs = val[1]
@@ -43,26 +202,26 @@ def get_data(func_gen=None, env_desc=None, plug_params=None):
         'stat': collections.defaultdict(int)
     }
 
-    dist_path = plug_params['file_path']
-    yar_paths = [
-        os.path.join(dist_path, f) 
-        for f in os.listdir(dist_path) 
-        if os.path.isfile(os.path.join(dist_path, f)) and f.endswith('.yar')
-    ]
-    yara_rules = {}
-
-    for p in yar_paths:
-        try:
-            n = os.path.basename(p)
-            yara_rules[n] = yara.compile(filepath=p)
-        except yara.Error as e:
-            ida_shims.msg("Error compiling rule '{}': {}".format(n, e))
+    dist_path = plug_params['file_path'][0]
+    yara_rules, rules_path = get_rules(get_rule_paths(dist_path))
+    if yara_rules is None:
+        return report if __name__ == '__main__' else report['data']
 
-    for func_addr in func_gen():
-        func_data = get_func_bytes(func_addr)
-        for _, rule_data in yara_rules.items():
-            match = rule_data.match(data=func_data)
-            for rule_name in match:
+    is_segment = 'mode' in plug_params and plug_params['mode'][0][1]
+    if is_segment:
+        rule_funcs = get_segment_matches(yara_rules, get_chunk_index(func_gen))
+        for rule_name in sorted(rule_funcs):
+            if len(rule_funcs[rule_name]):
+                report['data'][rule_name] = sorted(rule_funcs[rule_name])
+                report['stat'][rule_name] = len(rule_funcs[rule_name])
+    else:
+        func_addrs = list(func_gen())
+        # the functions are matched after the iteration, their times are passed back
+        record_time = getattr(func_gen, 'record_time', None)
+        for func_addr, rule_names, func_time in get_func_matches(yara_rules, rules_path, func_addrs):
+            if record_time:
+                record_time(func_addr, func_time)
+            for rule_name in rule_names:
                 report['data'][rule_name].append(func_addr)
                 report['stat'][rule_name] += 1
 
@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+import time
+#
+import yara
+#
+from idaclu import plg_utils
+
+
+PARALLEL_MIN_FUNCS = 2000  # below this the pool start-up costs more than it saves
+
+_worker_data = {}
+
+def get_rule_name(match):
+    # rule names are unique per namespace only, a namespace per rule file
+    return "{}:{}".format(match.namespace, match.rule)
+
+def get_rule_names(matches):
+    return sorted(set(get_rule_name(m) for m in matches))
+
+def init_match_worker(rules_path, snapshot):
+    _worker_data['rules'] = yara.load(rules_path)
+    _worker_data['reader'] = plg_utils.SnapshotReader(snapshot)
+
+def match_funcs(index_range):
+    yara_rules = _worker_data['rules']
+    reader = _worker_data['reader']
+    func_rules = []
+    for idx in range(*index_range):
+        time_beg = time.time()
+        matches = yara_rules.match(data=reader.get_func_bytes(idx))
+        func_rules.append((idx, get_rule_names(matches), time.time() - time_beg))
+    return func_rules
+
+def get_func_matches_parallel(rules_path, snapshot):
+    """Match the functions of a snapshot in worker processes.
+
+    The workers load the saved compiled rules instead of receiving them.
+    Returns [(func_addr, [rule_name], match time)] of all the functions
+    or None if processes cannot be spawned.
+    """
+    func_addrs = snapshot['funcs']
+    pool = plg_utils.get_process_pool(
+        os.path.dirname(os.path.abspath(__file__)),
+        init_match_worker, (rules_path, snapshot))
+    if pool is None:
+        return None
+
+    func_matches = []
+    index_ranges = plg_utils.get_index_chunks(len(func_addrs), multiprocessing.cpu_count() * 8)
+    try:
+        for func_rules in pool.imap_unordered(match_funcs, index_ranges):
+            func_matches.extend((func_addrs[idx], rule_names, func_time) for idx, rule_names, func_time in func_rules)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return sorted(func_matches)
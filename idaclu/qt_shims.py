@@ -518,6 +518,14 @@ def get_QThread():
         import PyQt5.QtCore as QtCore
         return QtCore.QThread
 
+def get_QTimer():
+    if is_ida and idaapi.IDA_SDK_VERSION <= 680:
+        import PySide.QtCore as QtCore
+        return QtCore.QTimer
+    else:
+        import PyQt5.QtCore as QtCore
+        return QtCore.QTimer
+
 def get_QTranslator():
     if is_ida and idaapi.IDA_SDK_VERSION <= 680:
         import PySide.QtCore as QtCore
@@ -638,6 +646,7 @@ QTextBrowser = get_QTextBrowser()
 QTextEdit = get_QTextEdit()
 QtGui = get_QtGui()
 QThread = get_QThread()
+QTimer = get_QTimer()
 QTranslator = get_QTranslator()
 QTreeView = get_QTreeView()
 QTreeWidget = get_QTreeWidget()
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import bisect
 from collections import defaultdict, OrderedDict
 from functools import partial
 from re import split
@@ -32,6 +33,7 @@ from idaclu.qt_shims import (
     QtCore,
     QTreeView,
     QThread,
+    QTimer,
     QVBoxLayout,
     QWidget,
     Signal
@@ -39,6 +41,7 @@ from idaclu.qt_shims import (
 
 from idaclu.qt_utils import i18n
 from idaclu import ida_shims
+from idaclu import ida_utils
 from idaclu import plg_utils
 
 
@@ -665,12 +668,20 @@ class FrameLayout(QWidget):
             painter.end()
 
 
+FILTER_DELAY = 200  # milliseconds of no typing before a filter is applied
+
+
 class FilterHeader(QHeaderView):
     filterChanged = Signal(int)
 
     def __init__(self, parent):
         super().__init__(Qt.Horizontal, parent)
         self._editors = []
+        self._pending = set()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(FILTER_DELAY)
+        self._timer.timeout.connect(self.emitPending)
         self._padding = 4
         self.filters_visible = False  # Initialize filters_visible
         self.setStretchLastSection(True)
@@ -687,11 +698,21 @@ class FilterHeader(QHeaderView):
         for index in range(count):
             editor = QLineEdit(self.parent())
             editor.setPlaceholderText('Filter')
-            editor.textChanged.connect(partial(self.filterChanged.emit, index))  # Emit filterChanged on each keystroke
+            editor.textChanged.connect(partial(self.delayFilter, index))  # Emit filterChanged once typing pauses
             editor.setVisible(self.filters_visible)  # Initial visibility state
             self._editors.append(editor)
         self.adjustPositions()
 
+    def delayFilter(self, index, text=None):
+        self._pending.add(index)
+        self._timer.start()
+
+    def emitPending(self):
+        pending = sorted(self._pending)
+        self._pending.clear()
+        for index in pending:
+            self.filterChanged.emit(index)
+
     def toggleFilterVisibility(self):
         """Toggle the visibility of the filter inputs."""
         self.filters_visible = not self.filters_visible
@@ -731,48 +752,72 @@ class FilterHeader(QHeaderView):
 
 
 class FilterProxyModel(QSortFilterProxyModel):
+    """Filter rows by substrings of their columns.
+
+    Matching rows are looked up in the column indexes of the source model,
+    a filter that only got longer re-tests the rows it accepted before.
+    """
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setDynamicSortFilter(True)
         self.filter_texts = {}
+        self.accepted = None  # sorted numbers of the matching rows
+        self.cluster_hits = set()
+        self.accepted_epoch = None
 
     def setFilterText(self, index, text):
-        self.filter_texts[index] = text.lower()
+        text = text.lower()
+        model = self.sourceModel()
+        is_narrower = (self.accepted is not None and
+                       self.accepted_epoch == model.index_epoch and
+                       self.filter_texts.get(index, '') in text)
+        self.filter_texts[index] = text
+        self.updateAccepted(is_narrower)
         self.invalidateFilter()
 
-    def filterAcceptsRow(self, source_row, source_parent):
+    def updateAccepted(self, is_narrower=False):
         model = self.sourceModel()
-        index = model.index(source_row, 0, source_parent)
-        # Both parent-items and child-items are processed by this function.
-        return self.hasMatch(index)
+        filters = [(col, text) for col, text in self.filter_texts.items() if text]
+        if len(filters) == 0:
+            self.accepted = None
+            return
 
-    def rowMatchesFilter(self, index):
-        filters = self.filter_texts.items()
+        rows = self.accepted if is_narrower else None
+        for col, filter_text in filters:
+            rows = model.getColumnIndex(col).find(filter_text, rows)
+        self.accepted = rows
+        self.accepted_epoch = model.index_epoch
+
+        # a cluster is kept for its matching rows or its own label
+        col_index = model.getColumnIndex(filters[0][0])
+        self.cluster_hits = set()
+        for clu_row in range(len(col_index.heads)):
+            row_beg = bisect.bisect_left(rows, col_index.offsets[clu_row])
+            if ((row_beg < len(rows) and rows[row_beg] < col_index.offsets[clu_row + 1]) or
+                all(filter_text in model.getColumnIndex(col).heads[clu_row] for col, filter_text in filters)):
+                self.cluster_hits.add(clu_row)
 
-        # No filters defined, so preserve any row.
-        if len(filters) == 0:
+    def filterAcceptsRow(self, source_row, source_parent):
+        # Both parent-items and child-items are processed by this function.
+        if self.accepted is None:
             return True
+        if not source_parent.isValid():
+            return source_row in self.cluster_hits
+        return self.rowMatchesFilter(source_parent.row(), source_row)
 
-        for col, filter_text in filters:
+    def rowMatchesFilter(self, clu_row, row):
+        # texts are checked directly, so that edited rows are up-to-date
+        model = self.sourceModel()
+        for col, filter_text in self.filter_texts.items():
             if filter_text:
-                cell_data = self.sourceModel().data(index.sibling(index.row(), col))
-                if filter_text not in cell_data.lower():
+                col_index = model.getColumnIndex(col)
+                if filter_text not in col_index.texts[col_index.getRow(clu_row, row)]:
                     return False
 
         # Preserve row if no filter triggered reject in this row.
         return True
 
-    def hasMatch(self, parent_index):
-        model = self.sourceModel()
-        row_count = model.rowCount(parent_index)
-
-        for row in range(row_count):
-            child_index = model.index(row, 0, parent_index)
-            if self.rowMatchesFilter(child_index):
-                return True
-
-        return self.rowMatchesFilter(parent_index)
-
     def lessThan(self, left_index, right_index):
         # Fetch data for comparison
         left_data = left_index.data()
@@ -804,18 +849,22 @@ class FilterProxyModel(QSortFilterProxyModel):
             else:
                 # Sort the root level
                 self.sort_root_items(source_model, column, order)
+            # indexed rows are numbered in the sorted order
+            source_model.invalidateIndex()
+            self.updateAccepted()
 
         # self.endResetModel()
         self.layoutChanged.emit()
 
     def sort_root_items(self, model, column, order):
-        model.iroot._children.sort(key=lambda x: self.natural_sort_key(x.data(column)),
-                                    reverse=(order == Qt.DescendingOrder))
+        model.iroot.sortChildren(key=lambda x: self.natural_sort_key(x.data(column, model.fmts[column])),
+                                 reverse=(order == Qt.DescendingOrder))
 
     def sort_child_items(self, model, column, order):
         for i, child in enumerate(model.iroot._children):
-            child._children.sort(key=lambda x: self.natural_sort_key(x.data(column)),
-                                reverse=(order == Qt.DescendingOrder))
+            # the rows not fetched yet are sorted along with the fetched ones
+            child.sortRows(key=lambda row: self.natural_sort_key(child.rowData(row, column, model.fmts[column])),
+                           reverse=(order == Qt.DescendingOrder))
 
 
 class CluTreeView(QTreeView):
@@ -836,7 +885,8 @@ class CluTreeView(QTreeView):
         if self.env.feat_folders:
             self.heads.insert(1, 'Folder')
         self.expanded_state = {}
-        self.rec_indx = defaultdict(list)
+        self._rec_indx = defaultdict(list)
+        self.is_rec_stale = False
 
         self._header = FilterHeader(self)
         self._header.filterChanged.connect(self.applyFilter)  # Connect signal for instant filtering
@@ -849,7 +899,6 @@ class CluTreeView(QTreeView):
         isChildSort = bool(self.expanded_state) and any(value == True for value in self.expanded_state.values())
         model = self.model()
         model.sort(logicalIndex, currentOrder, int(isChildSort))
-        self.indexRecords()
 
         root_idx = QtCore.QModelIndex()
         clu_count = model.rowCount(root_idx)
@@ -861,18 +910,31 @@ class CluTreeView(QTreeView):
                     break
 
         self.model().invalidateFilter()
-        self.indexRecords()
+        self.staleRecords()
+
+    @property
+    def rec_indx(self):
+        # rows are re-indexed on demand, not after every sort
+        if self.is_rec_stale:
+            self.indexRecords()
+        return self._rec_indx
+
+    def staleRecords(self, *args):
+        self.is_rec_stale = True
 
     def indexRecords(self):
-        self.rec_indx.clear()
-        model = self.model()
+        # rows of the source model, the filtered and not fetched ones included,
+        # by the start of the function of their address
+        self.is_rec_stale = False
+        self._rec_indx.clear()
+        model = self.model().sourceModel()
         id_col = self.heads.index('Address')
         root_idx = QtCore.QModelIndex()
         for r_num in range(model.rowCount(root_idx)):
             p_idx = model.index(r_num, 0, root_idx)
-            for c_num in range(model.rowCount(p_idx)):
-                index = model.index(c_num, id_col, p_idx)
-                self.rec_indx[int(index.data(), 16)].append((r_num, c_num))
+            for c_num in range(model.rowTotal(p_idx)):
+                func_start = ida_utils.get_func_start(model.rowValue(p_idx, c_num, id_col))
+                self._rec_indx[func_start].append((r_num, c_num))
 
     def save_expanded_state(self, index):
         self.expanded_state[index.data()] = self.isExpanded(index)
@@ -894,7 +956,6 @@ class CluTreeView(QTreeView):
     def applyFilter(self, index):
         filter_text = self._header.filterText(index)
         self.proxy_model.setFilterText(index, filter_text)
-        self.indexRecords()
 
 
 class ConfigTool(QWidget):